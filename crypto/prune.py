@@ -1,63 +1,237 @@
 import os
 import re
+import sqlite3
+import threading
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Threshold settings
 THRESHOLD_DATE = "2023-06-01"
 MAX_COMPRESSION_SIZE = 8
 PLOTS_PER_DAY = 1000
 PLOTS_PER_HOUR = PLOTS_PER_DAY // 24
+# When set, delete on each mount only until it has this much free space (still at most
+# PLOTS_PER_HOUR per mount per hour) instead of PLOTS_PER_HOUR across the whole farm
+FREE_SPACE_TARGET_GB = 0
+CYCLE_SECONDS = 3600
 
 # Directory to monitor
 FARM_DIR = "/farm"
 
-# Regular expressions
-COMPRESSED_PLOTS = r"plot-k32-c(\d{1,2})-(\d{4}-\d{2}-\d{2})-\d{2}-\d{2}-[a-f0-9]+.plot"
-UNCOMPRESSED_PLOTS = r"plot-k32-(\d{4}-\d{2}-\d{2})-\d{2}-\d{2}-[a-f0-9]+.plot"
+# Plot index: every plot under FARM_DIR plus each directory's mtime, so a refresh only
+# lists directories whose contents changed and never stats plots it already knows
+INDEX_PATH = os.path.expanduser("~/.cache/prune/plot_index.sqlite")
+INDEX_SCHEMA_VERSION = 2
 
-def delete_old_plots():
-    while True:
-        all_files = [os.path.join(dp, f) for dp, dn, filenames in os.walk(FARM_DIR) for f in filenames]
-
-        candidates_with_c = []
-        candidates_without_c = []
-        for filepath in all_files:
-            filename = os.path.basename(filepath)
-            match_with_c = re.match(COMPRESSED_PLOTS, filename)
-            match_without_c = re.match(UNCOMPRESSED_PLOTS, filename)
-            if match_with_c:
-                compression_size, date = int(match_with_c.group(1)), match_with_c.group(2)
-                if date < THRESHOLD_DATE and compression_size <= MAX_COMPRESSION_SIZE:
-                    candidates_with_c.append(filepath)
-            elif match_without_c:
-                candidates_without_c.append(filepath)
-
-        random.shuffle(candidates_with_c)
-        random.shuffle(candidates_without_c)
-
-        total_deleted = 0
-
-        # Delete files without 'C' value first
-        for filepath in candidates_without_c:
-            if total_deleted < PLOTS_PER_HOUR:
-                os.remove(filepath)
-                print(f"Deleted: {filepath}")
-                total_deleted += 1
+# Compressed (plot-k32-cNN-DATE-...) and uncompressed (plot-k32-DATE-...) plots in one pass;
+# compression is None for uncompressed plots
+PLOT_PATTERN = re.compile(r"plot-k32-(?:c(\d{1,2})-)?(\d{4}-\d{2}-\d{2})-\d{2}-\d{2}-[a-f0-9]+.plot")
+
+def open_index(index_path=INDEX_PATH):
+    """Open the SQLite plot index, rebuilding it if the schema version changed"""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS dirs")
+        conn.execute("DROP TABLE IF EXISTS plots")
+        conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            parent TEXT,
+            mtime_ns INTEGER NOT NULL
+        )""")
+    # dev is st_dev of the plot's directory: one value per mounted disk
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS plots (
+            path TEXT PRIMARY KEY,
+            dir TEXT NOT NULL,
+            dev INTEGER NOT NULL,
+            compression INTEGER,
+            date TEXT NOT NULL,
+            size INTEGER NOT NULL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS plots_dir ON plots (dir)")
+    conn.execute("CREATE INDEX IF NOT EXISTS plots_dev ON plots (dev)")
+    return conn
+
+def scan_dir(conn, path, mtime_ns, dev):
+    """Re-list one changed directory, returning its subdirectories"""
+    subdirs, plots = [], {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
             else:
+                match = PLOT_PATTERN.match(entry.name)
+                if match:
+                    plots[entry.path] = match
+
+    indexed = {p for (p,) in conn.execute("SELECT path FROM plots WHERE dir = ?", (path,))}
+    conn.executemany("DELETE FROM plots WHERE path = ?", [(p,) for p in indexed - plots.keys()])
+    for plot_path, match in plots.items():
+        if plot_path in indexed:
+            continue
+        try:
+            size = os.stat(plot_path).st_size
+        except OSError:
+            continue
+        compression = int(match.group(1)) if match.group(1) is not None else None
+        conn.execute("INSERT INTO plots VALUES (?, ?, ?, ?, ?, ?)",
+                     (plot_path, path, dev, compression, match.group(2), size))
+    conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (path, os.path.dirname(path), mtime_ns))
+    return subdirs
+
+def refresh_index(conn, root=FARM_DIR):
+    """Bring the index up to date, listing only directories whose mtime changed since the last refresh"""
+    known = dict(conn.execute("SELECT path, mtime_ns FROM dirs"))
+    children = {}
+    for path, parent in conn.execute("SELECT path, parent FROM dirs"):
+        children.setdefault(parent, []).append(path)
+
+    seen, scanned = set(), 0
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            # stat before listing so a change made mid-scan is picked up next time
+            stat = os.stat(path)
+        except OSError:
+            continue
+        seen.add(path)
+        if known.get(path) == stat.st_mtime_ns:
+            # Same entries as last time, so the same subdirectories; only they need checking
+            stack.extend(children.get(path, []))
+            continue
+        try:
+            stack.extend(scan_dir(conn, path, stat.st_mtime_ns, stat.st_dev))
+            scanned += 1
+        except OSError as e:
+            # Keep what the index already has for an unreadable disk
+            print(f"Error scanning {path}: {e}")
+            stack.extend(children.get(path, []))
+
+    gone = [(path,) for path in known if path not in seen]
+    conn.executemany("DELETE FROM plots WHERE dir = ?", gone)
+    conn.executemany("DELETE FROM dirs WHERE path = ?", gone)
+    return scanned
+
+CANDIDATE_QUERY = """
+    SELECT path, dir, dev, size FROM plots
+    WHERE (compression IS NULL OR (date < ? AND compression <= ?)) {}
+    ORDER BY compression IS NOT NULL, random()
+    LIMIT ?"""
+
+def deletion_candidates(conn, limit, dev=None):
+    """Up to limit (path, dir, dev, size) plots to delete, optionally on one mount only
+
+    Uncompressed plots come first, then old low-compression plots, random within each.
+    """
+    if dev is None:
+        return conn.execute(CANDIDATE_QUERY.format(""), (THRESHOLD_DATE, MAX_COMPRESSION_SIZE, limit)).fetchall()
+    return conn.execute(CANDIDATE_QUERY.format("AND dev = ?"),
+                        (THRESHOLD_DATE, MAX_COMPRESSION_SIZE, dev, limit)).fetchall()
+
+def free_bytes(path):
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+def plan_deletions(conn):
+    """Map each mount (st_dev) to the plots to delete from it this cycle"""
+    plan = {}
+    if not FREE_SPACE_TARGET_GB:
+        for candidate in deletion_candidates(conn, PLOTS_PER_HOUR):
+            plan.setdefault(candidate[2], []).append(candidate)
+        return plan
+
+    target = FREE_SPACE_TARGET_GB * 1000**3
+    for (dev,) in conn.execute("SELECT DISTINCT dev FROM plots"):
+        candidates = deletion_candidates(conn, PLOTS_PER_HOUR, dev)
+        if not candidates:
+            continue
+        try:
+            needed = target - free_bytes(candidates[0][1])
+        except OSError as e:
+            print(f"Skipping {candidates[0][1]}: {e}")
+            continue
+        chosen = []
+        for candidate in candidates:
+            if needed <= 0:
+                break
+            chosen.append(candidate)
+            needed -= candidate[3]
+        if chosen:
+            plan[dev] = chosen
+    return plan
+
+class TokenBucket:
+    """Token bucket holding at most one token, refilled at rate tokens per second, so takes are evenly spaced"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_token = time.monotonic()
+
+    def take(self, deadline, stop):
+        """Wait for a token; False if it would not arrive before deadline or stop was set while waiting"""
+        self.next_token = max(self.next_token, time.monotonic())
+        if self.next_token > deadline:
+            return False
+        if stop.wait(max(0, self.next_token - time.monotonic())):
+            return False
+        self.next_token += self.interval
+        return True
+
+def prune_mount(plots, deadline, stop):
+    """Delete one mount's plots one at a time, spread evenly until deadline; returns the deleted paths
+
+    An I/O error stops this mount until the next cycle without affecting the others.
+    """
+    bucket = TokenBucket(len(plots) / max(deadline - time.monotonic(), 1))
+    target = FREE_SPACE_TARGET_GB * 1000**3
+    deleted = []
+    for filepath, directory, _, _ in plots:
+        if not bucket.take(deadline, stop):
+            break
+        try:
+            if target and free_bytes(directory) >= target:
                 break
+            os.remove(filepath)
+            print(f"Deleted: {filepath}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # EIO, EROFS, ...: a failing disk; leave its remaining plots for the next cycle
+            print(f"Error deleting {filepath}, skipping its mount this cycle: {e}")
+            break
+        deleted.append(filepath)
+    return deleted
+
+def delete_old_plots():
+    conn = open_index()
+    while True:
+        deadline = time.monotonic() + CYCLE_SECONDS
+        with conn:
+            scanned = refresh_index(conn)
+        print(f"Index refreshed, {scanned} directories rescanned")
+
+        # One worker per mount: disks delete in parallel, but never two files on one spindle at once
+        plan = plan_deletions(conn)
+        stop = threading.Event()
+        deleted = []
+        if plan:
+            with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+                futures = [executor.submit(prune_mount, plots, deadline, stop) for plots in plan.values()]
+                try:
+                    for future in futures:
+                        deleted.extend(future.result())
+                except BaseException:
+                    stop.set()
+                    raise
+
+        with conn:
+            conn.executemany("DELETE FROM plots WHERE path = ?", [(p,) for p in deleted])
 
-        # If there's still capacity, delete files with 'C' value
-        if total_deleted < PLOTS_PER_HOUR:
-            for filepath in candidates_with_c:
-                if total_deleted < PLOTS_PER_HOUR:
-                    os.remove(filepath)
-                    print(f"Deleted: {filepath}")
-                    total_deleted += 1
-                else:
-                    break
-
-        time.sleep(3600)
+        time.sleep(max(0, deadline - time.monotonic()))
 
 if __name__ == "__main__":
     delete_old_plots()
@@ -1,43 +1,410 @@
+import argparse
+import json
 import os
 import csv
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-def calculate_averages(log_dir):
-    results = {}
-    for filename in os.listdir(log_dir):
-        if filename.endswith("_bw_log.log") or filename.endswith("_iops_log.log"):
-            filepath = os.path.join(log_dir, filename)
-            is_bw = "_bw_" in filename
-            key = filename.split('_')[0]
-            if key not in results:
-                results[key] = {"read_bw": 0, "write_bw": 0, "read_iops": 0, "write_iops": 0}
-
-            read_total, write_total, read_count, write_count = 0, 0, 0, 0
-            with open(filepath, 'r') as file:
-                for line in file:
-                    parts = line.split(',')
-                    if len(parts) >= 3:
-                        value = float(parts[1].strip())
-                        rw_type = int(parts[2].strip())  # 0 for read, 1 for write
-                        if rw_type == 0:  # Read
-                            read_total += value
-                            read_count += 1
-                        elif rw_type == 1:  # Write
-                            write_total += value
-                            write_count += 1
-
-            if is_bw:
-                if read_count > 0:
-                    results[key]["read_bw"] = read_total / read_count
-                if write_count > 0:
-                    results[key]["write_bw"] = write_total / write_count
-            else:  # iops log
-                if read_count > 0:
-                    results[key]["read_iops"] = read_total / read_count
-                if write_count > 0:
-                    results[key]["write_iops"] = write_total / write_count
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# fio log rows are "time, value, ddir, bs, offset[, prio]"; only the first three matter here
+LOG_COLUMNS = ['time', 'value', 'ddir']
+READ, WRITE = 0, 1  # ddir values; 2 (trim) is ignored
+DIRECTIONS = {READ: "read", WRITE: "write"}
+CHUNK_ROWS = 1_000_000  # rows per block, bounds memory regardless of log size
+# bw/iops log suffix -> metric. Logs are named {host}_{job}_bw_log.log, or {host}_bw_log.log for one job.
+RATE_LOGS = {"_bw_log.log": "bw", "_iops_log.log": "iops"}
+
+# Parsed-log cache: one row of window sums per log file, keyed by path + mtime + size + window
+CACHE_PATH = os.path.expanduser("~/.cache/parse_fio/log_cache.sqlite")
+CACHE_SCHEMA_VERSION = 1
+
+# Series and steady-state defaults. Log timestamps are in milliseconds.
+WINDOW_MS = 1000
+ROUND_MS = 60_000
+PERCENTILES = [50, 99, 99.9]
+# SNIA PTS steady state: over a measurement window of STEADY_ROUNDS rounds, the data excursion
+# (max - min) stays within 20% of the window average and the best-fit line's excursion within 10%
+STEADY_ROUNDS = 5
+STEADY_RANGE = 0.20
+STEADY_SLOPE = 0.10
+
+# fio's latency histogram layout (stat.h): FIO_IO_U_PLAT_GROUP_NR groups of 2^FIO_IO_U_PLAT_BITS
+# buckets, each group twice as wide as the last, so any value is within 1/64 of its bucket
+FIO_IO_U_PLAT_BITS = 6
+FIO_IO_U_PLAT_VAL = 1 << FIO_IO_U_PLAT_BITS
+FIO_IO_U_PLAT_GROUP_NR = 29
+FIO_IO_U_PLAT_NR = FIO_IO_U_PLAT_GROUP_NR * FIO_IO_U_PLAT_VAL
+LATENCY_PERCENTILES = [50, 99, 99.9, 99.99]
+# Latency log suffix -> metric; --write_hist_log output is a clat histogram.
+# Longest suffix first, since "_clat_log.log" also ends with "_lat_log.log".
+LATENCY_LOGS = {"_clat_hist_log.log": "clat_hist", "_clat_log.log": "clat", "_lat_log.log": "lat"}
+HIST_CHUNK_ROWS = 2000  # histogram rows carry 1856 bins each
+
+def read_log_chunks(filepath, chunk_rows=CHUNK_ROWS, numeric_time=True):
+    """Yield (time, value, ddir) float arrays for the read and write rows of a fio log, one block at a time
+
+    numeric_time=False reads the time column as text, for logs with non-numeric lines in them.
+    """
+    dtype = {'time': 'float64' if numeric_time else 'str', 'value': 'float64', 'ddir': 'float64'}
+    reader = pd.read_csv(filepath, header=None, names=LOG_COLUMNS, usecols=LOG_COLUMNS, index_col=False,
+                         dtype=dtype, skipinitialspace=True, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            # Short or malformed lines come through as NaN and are skipped, like the old split() check
+            chunk = chunk.dropna(subset=['value', 'ddir'])
+            chunk = chunk[chunk['ddir'].isin((READ, WRITE))]
+            time = pd.to_numeric(chunk['time'], errors='coerce').to_numpy(dtype='float64')
+            yield time, chunk['value'].to_numpy(), chunk['ddir'].to_numpy()
+
+class LogStats:
+    """Per-window sums and counts of one fio log, by direction, accumulated block by block"""
+
+    def __init__(self, window_ms=WINDOW_MS):
+        self.window_ms = window_ms
+        self.sums = np.zeros((0, 2))
+        self.counts = np.zeros((0, 2), dtype=np.int64)
+
+    def add(self, time, values, ddir):
+        """Fold one block of samples into the window sums"""
+        if len(values) == 0:
+            return
+        window = np.maximum(np.nan_to_num(time) // self.window_ms, 0).astype(np.intp)
+        # Flat (window, ddir) bins so one bincount covers both directions
+        bins = window * 2 + ddir.astype(np.intp)
+        rows = max(int(window.max()) + 1, len(self.sums))
+        sums = np.bincount(bins, weights=values, minlength=rows * 2).reshape(rows, 2)
+        counts = np.bincount(bins, minlength=rows * 2).reshape(rows, 2)
+        sums[:len(self.sums)] += self.sums
+        counts[:len(self.counts)] += self.counts
+        self.sums, self.counts = sums, counts
+
+    def average(self, direction, start_window=0):
+        """Mean sample value for one direction from start_window on, or None if it has no samples"""
+        count = self.counts[start_window:, direction].sum()
+        if count == 0:
+            return None
+        return float(self.sums[start_window:, direction].sum() / count)
+
+    def series(self, windows_per_point=1):
+        """Per-window mean values as a (windows, 2) array, NaN where a window has no samples"""
+        sums, counts = self.sums, self.counts
+        if windows_per_point > 1:
+            pad = -len(sums) % windows_per_point
+            sums = np.pad(sums, ((0, pad), (0, 0))).reshape(-1, windows_per_point, 2).sum(axis=1)
+            counts = np.pad(counts, ((0, pad), (0, 0))).reshape(-1, windows_per_point, 2).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def percentiles(self, direction):
+        """PERCENTILES of the per-window means for one direction, or None if it has no samples"""
+        values = self.series()[:, direction]
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return None
+        return np.percentile(values, PERCENTILES)
+
+    def steady_state(self, direction, round_ms=ROUND_MS):
+        """First window of the first steady measurement window for one direction, or None"""
+        per_round = max(round_ms // self.window_ms, 1)
+        rounds = self.series(per_round)[:, direction]
+        if len(rounds) < STEADY_ROUNDS:
+            return None
+
+        measurement = sliding_window_view(rounds, STEADY_ROUNDS)
+        average = measurement.mean(axis=1)
+        excursion = measurement.max(axis=1) - measurement.min(axis=1)
+        # Least-squares slope over rounds 0..N-1, scaled to its excursion across the window
+        x = np.arange(STEADY_ROUNDS) - (STEADY_ROUNDS - 1) / 2
+        slope = measurement @ x / (x @ x)
+        slope_excursion = np.abs(slope) * (STEADY_ROUNDS - 1)
+
+        with np.errstate(invalid='ignore'):
+            steady = ((excursion <= STEADY_RANGE * average)
+                      & (slope_excursion <= STEADY_SLOPE * average)
+                      & (average > 0))
+        if not steady.any():
+            return None
+        return int(np.argmax(steady)) * per_round
+
+def read_log_stats(filepath, window_ms=WINDOW_MS):
+    """Read one fio log in a single streaming pass"""
+    try:
+        stats = LogStats(window_ms)
+        for time, values, ddir in read_log_chunks(filepath):
+            stats.add(time, values, ddir)
+    except ValueError:
+        # A garbage line broke the all-numeric fast path; start over reading time as text
+        stats = LogStats(window_ms)
+        for time, values, ddir in read_log_chunks(filepath, numeric_time=False):
+            stats.add(time, values, ddir)
+    return stats
+
+def parse_log_name(filename, suffixes=RATE_LOGS):
+    """Split a log file name into (host, job, metric), or None if it is not one of suffixes"""
+    for suffix, metric in suffixes.items():
+        if filename.endswith(suffix):
+            host, _, job = filename[:-len(suffix)].partition('_')
+            return host, job, metric
+    return None
+
+def find_logs(log_dir, suffixes=RATE_LOGS):
+    """Map (host, job, metric) to (path, mtime_ns, size) for logs anywhere under log_dir
+
+    Logs in subdirectories get the directory relative to log_dir in front of the job
+    (run1/test1, or run1/ for a single-job log), so the same file name in two runs stays two logs.
+    """
+    logs = {}
+    for root, _, filenames in os.walk(log_dir):
+        subdir = os.path.relpath(root, log_dir)
+        for filename in sorted(filenames):
+            key = parse_log_name(filename, suffixes)
+            if key is None:
+                continue
+            if subdir != os.curdir:
+                host, job, metric = key
+                key = (host, "/".join(subdir.split(os.sep) + [job]), metric)
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            logs[key] = (path, stat.st_mtime_ns, stat.st_size)
+    return logs
+
+def open_log_cache(cache_path=CACHE_PATH):
+    """Open the SQLite log cache, rebuilding it if the schema version changed"""
+    try:
+        if cache_path is None:
+            conn = sqlite3.connect(":memory:")
+        else:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            conn = sqlite3.connect(cache_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Log cache unavailable ({e}), parsing all files")
+        conn = sqlite3.connect(":memory:")
+
+    if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS logs")
+        conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS logs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            window_ms INTEGER NOT NULL,
+            sums BLOB NOT NULL,
+            counts BLOB NOT NULL
+        )""")
+    return conn
+
+def analyze_logs(log_dir, window_ms=WINDOW_MS, max_workers=None, cache_path=CACHE_PATH):
+    """Map (host, job, metric) to LogStats for every bw and iops log under log_dir
+
+    Logs unchanged since the last run come from the cache at cache_path (None disables it);
+    the rest are parsed across a process pool.
+    """
+    logs = find_logs(log_dir)
+    conn = open_log_cache(cache_path)
+    try:
+        with conn:
+            stats, stale = {}, []
+            for key, (path, mtime_ns, size) in logs.items():
+                row = conn.execute("SELECT sums, counts FROM logs WHERE path = ? AND mtime_ns = ? AND size = ? "
+                                   "AND window_ms = ?", (path, mtime_ns, size, window_ms)).fetchone()
+                if row is None:
+                    stale.append(key)
+                    continue
+                log_stats = LogStats(window_ms)
+                log_stats.sums = np.frombuffer(row[0], dtype=np.float64).reshape(-1, 2)
+                log_stats.counts = np.frombuffer(row[1], dtype=np.int64).reshape(-1, 2)
+                stats[key] = log_stats
+
+            paths = [logs[key][0] for key in stale]
+            if len(paths) > 1 and max_workers != 1:
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    parsed = list(executor.map(read_log_stats, paths, repeat(window_ms)))
+            else:
+                parsed = [read_log_stats(path, window_ms) for path in paths]
+
+            for key, log_stats in zip(stale, parsed):
+                path, mtime_ns, size = logs[key]
+                conn.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?)",
+                             (path, mtime_ns, size, window_ms, log_stats.sums.tobytes(), log_stats.counts.tobytes()))
+                stats[key] = log_stats
+    finally:
+        conn.close()
+    return dict(sorted(stats.items()))
+
+def summarize(stats, steady_state=False, round_ms=ROUND_MS):
+    """Reduce analyze_logs output to the per-host averages written by write_to_csv
 
+    Jobs of one host in the same directory run side by side, so their averages add up.
+    Logs in subdirectories are separate runs and are reported as {subdir}/{host}.
+    """
+    results = {}
+    for (host, job, metric), log_stats in stats.items():
+        run = job.rpartition("/")[0]
+        if run:
+            host = f"{run}/{host}"
+        if host not in results:
+            results[host] = {"read_bw": 0, "write_bw": 0, "read_iops": 0, "write_iops": 0}
+        for direction, name in DIRECTIONS.items():
+            start = 0
+            if steady_state:
+                # Logs that never settle fall back to the whole run
+                start = log_stats.steady_state(direction, round_ms) or 0
+            average = log_stats.average(direction, start)
+            if average is not None:
+                results[host][f"{name}_{metric}"] += average
     return results
 
+def calculate_averages(log_dir, steady_state=False, window_ms=WINDOW_MS, round_ms=ROUND_MS,
+                       max_workers=None, cache_path=CACHE_PATH):
+    stats = analyze_logs(log_dir, window_ms, max_workers, cache_path)
+    return summarize(stats, steady_state, round_ms)
+
+def plat_val_to_idx(values):
+    """Map latencies in ns to fio histogram bucket indexes (vectorized plat_val_to_idx from stat.c)"""
+    values = np.asarray(values, dtype=np.uint64)
+    # frexp is exact here: latencies stay far below 2^53 ns
+    _, exponent = np.frexp(values.astype(np.float64))
+    msb = np.maximum(exponent.astype(np.int64) - 1, 0)
+    error_bits = np.maximum(msb - FIO_IO_U_PLAT_BITS, 0)
+    base = (error_bits + 1) << FIO_IO_U_PLAT_BITS
+    offset = (values >> error_bits.astype(np.uint64)).astype(np.int64) & (FIO_IO_U_PLAT_VAL - 1)
+    index = np.minimum(base + offset, FIO_IO_U_PLAT_NR - 1)
+    return np.where(msb <= FIO_IO_U_PLAT_BITS, values.astype(np.int64), index)
+
+def plat_idx_to_val(index):
+    """Representative latency in ns of fio histogram buckets (vectorized plat_idx_to_val from stat.c)"""
+    index = np.asarray(index, dtype=np.int64)
+    error_bits = np.maximum((index >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    base = np.left_shift(1, error_bits + FIO_IO_U_PLAT_BITS).astype(np.float64)
+    k = index % FIO_IO_U_PLAT_VAL
+    value = base + (k + 0.5) * np.left_shift(1, error_bits)
+    return np.where(index < (FIO_IO_U_PLAT_VAL << 1), index, value)
+
+class LatencyHistogram:
+    """Per-direction latency counts in fio's log-bucketed layout; histograms merge by addition"""
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros((2, FIO_IO_U_PLAT_NR), dtype=np.int64) if counts is None else counts
+
+    def add_samples(self, values, ddir):
+        """Count raw latency samples (ns) from a lat/clat log"""
+        bins = ddir.astype(np.intp) * FIO_IO_U_PLAT_NR + plat_val_to_idx(values)
+        self.counts += np.bincount(bins, minlength=2 * FIO_IO_U_PLAT_NR).reshape(2, -1)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def total(self, direction):
+        return int(self.counts[direction].sum())
+
+    def percentiles(self, direction, percentiles=LATENCY_PERCENTILES):
+        """Latency in ns at each percentile, exact to bucket precision, or None if there are no samples"""
+        cumulative = np.cumsum(self.counts[direction])
+        if cumulative[-1] == 0:
+            return None
+        # Same rule as fio's calc_clat_percentiles: first bucket holding the p-th sample
+        thresholds = cumulative[-1] * np.asarray(percentiles) / 100
+        return plat_idx_to_val(np.searchsorted(cumulative, thresholds))
+
+    def to_dict(self):
+        """Sparse {direction: {bucket: count}} form, a few KB however many samples went in"""
+        return {name: {int(i): int(self.counts[direction, i]) for i in np.flatnonzero(self.counts[direction])}
+                for direction, name in DIRECTIONS.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for direction, name in DIRECTIONS.items():
+            for index, count in data.get(name, {}).items():
+                histogram.counts[direction, int(index)] += count
+        return histogram
+
+def read_latency_log(filepath):
+    """Bucket a lat/clat log into a LatencyHistogram in one streaming pass"""
+    histogram = LatencyHistogram()
+    try:
+        for _, values, ddir in read_log_chunks(filepath):
+            histogram.add_samples(values, ddir)
+    except ValueError:
+        histogram = LatencyHistogram()
+        for _, values, ddir in read_log_chunks(filepath, numeric_time=False):
+            histogram.add_samples(values, ddir)
+    return histogram
+
+def read_hist_log(filepath, chunk_rows=HIST_CHUNK_ROWS):
+    """Sum a --write_hist_log file ("time, ddir, bs, bin0, ...", per-interval counts) into a LatencyHistogram"""
+    with open(filepath) as f:
+        columns = len(f.readline().split(','))
+    bins = columns - 3
+    # log_hist_coarseness=N merges 2^N neighbouring buckets; put each count at the middle of its group
+    coarseness = FIO_IO_U_PLAT_NR // bins if bins > 0 else 0
+    if coarseness == 0 or bins * coarseness != FIO_IO_U_PLAT_NR:
+        raise ValueError(f"{columns} columns is not a fio histogram log")
+    fine_index = np.arange(bins) * coarseness + coarseness // 2
+
+    histogram = LatencyHistogram()
+    reader = pd.read_csv(filepath, header=None, names=range(columns), index_col=False, dtype='float64',
+                         skipinitialspace=True, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            # A partially written last row comes through with NaN bins
+            rows = chunk.dropna().to_numpy()
+            for direction in DIRECTIONS:
+                counts = rows[rows[:, 1] == direction, 3:].sum(axis=0)
+                histogram.counts[direction, fine_index] += counts.astype(np.int64)
+    return histogram
+
+def analyze_latency_logs(log_dir):
+    """Map (host, metric) to LatencyHistogram for every lat, clat and histogram log under log_dir
+
+    Histograms from several jobs on one host are merged.
+    """
+    histograms = {}
+    for (host, _, metric), (path, _, _) in find_logs(log_dir, LATENCY_LOGS).items():
+        try:
+            histogram = read_hist_log(path) if metric == "clat_hist" else read_latency_log(path)
+        except ValueError as e:
+            # Empty or truncated log, e.g. a job killed before its first interval
+            print(f"Skipping {path}: {e}")
+            continue
+        histograms.setdefault((host, metric), LatencyHistogram()).merge(histogram)
+    return histograms
+
+def merge_histograms(histograms):
+    """Fold per-host histograms into one fleet-wide ("All") histogram per metric"""
+    merged = {}
+    for (_, metric), histogram in histograms.items():
+        merged.setdefault(("All", metric), LatencyHistogram()).merge(histogram)
+    return merged
+
+def save_histograms(histograms, output_file):
+    """Save (host, metric) histograms as JSON that load_histograms can read back and merge"""
+    data = {
+        "plat_bits": FIO_IO_U_PLAT_BITS,
+        "histograms": [{"host": key, "metric": metric, **histogram.to_dict()}
+                       for (key, metric), histogram in histograms.items()],
+    }
+    with open(output_file, 'w') as f:
+        json.dump(data, f)
+
+def load_histograms(input_file, histograms=None):
+    """Load saved histograms, merging them into histograms when given"""
+    with open(input_file) as f:
+        data = json.load(f)
+    if data.get("plat_bits") != FIO_IO_U_PLAT_BITS:
+        raise ValueError(f"{input_file}: histograms use plat_bits={data.get('plat_bits')}, expected {FIO_IO_U_PLAT_BITS}")
+    histograms = {} if histograms is None else histograms
+    for entry in data["histograms"]:
+        histogram = LatencyHistogram.from_dict(entry)
+        histograms.setdefault((entry["host"], entry["metric"]), LatencyHistogram()).merge(histogram)
+    return histograms
+
 def write_to_csv(results, output_file):
     with open(output_file, 'w', newline='') as csvfile:
         fieldnames = ['Host', 'Avg Read Bandwidth', 'Avg Write Bandwidth', 'Avg Read IOPS', 'Avg Write IOPS']
@@ -48,9 +415,86 @@ def write_to_csv(results, output_file):
                              'Avg Write Bandwidth': data["write_bw"], 'Avg Read IOPS': data["read_iops"],
                              'Avg Write IOPS': data["write_iops"]})
 
+def write_series(stats, output_dir):
+    """Write one {host}[_{job}]_{metric}_series.csv per log with the per-window read and write means"""
+    os.makedirs(output_dir, exist_ok=True)
+    for (host, job, metric), log_stats in stats.items():
+        series = log_stats.series()
+        frame = pd.DataFrame({
+            'Time (s)': np.arange(len(series)) * log_stats.window_ms / 1000,
+            'Read': series[:, READ],
+            'Write': series[:, WRITE],
+        })
+        name = "_".join(part for part in (host, job.replace("/", "_").strip("_"), metric) if part)
+        frame.to_csv(os.path.join(output_dir, f"{name}_series.csv"), index=False)
+
+def write_window_stats(stats, output_file, round_ms=ROUND_MS):
+    """Write per-window percentiles and the detected steady state for every log and direction"""
+    with open(output_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Host', 'Job', 'Metric', 'Direction'] + [f'p{p:g}' for p in PERCENTILES]
+                        + ['Steady Start (s)', 'Steady Avg'])
+        for (host, job, metric), log_stats in stats.items():
+            for direction, name in DIRECTIONS.items():
+                percentiles = log_stats.percentiles(direction)
+                if percentiles is None:
+                    continue
+                start = log_stats.steady_state(direction, round_ms)
+                steady = ['', ''] if start is None else [
+                    start * log_stats.window_ms / 1000, log_stats.average(direction, start)]
+                writer.writerow([host, job, metric, name] + list(percentiles) + steady)
+
+def write_latency_percentiles(histograms, output_file):
+    """Write LATENCY_PERCENTILES in usec per host, metric and direction, followed by fleet-wide rows"""
+    with open(output_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Host', 'Metric', 'Direction', 'Samples'] + [f'p{p:g} (usec)' for p in LATENCY_PERCENTILES])
+        for (key, metric), histogram in {**histograms, **merge_histograms(histograms)}.items():
+            for direction, name in DIRECTIONS.items():
+                percentiles = histogram.percentiles(direction)
+                if percentiles is None:
+                    continue
+                writer.writerow([key, metric, name, histogram.total(direction)] + list(percentiles / 1000))
+
 if __name__ == "__main__":
-    log_directory = "/root/logs"  # Change this to your logs directory
-    output_csv_path = "/root/output.csv"  # Change this to your desired output CSV file path
-    results = calculate_averages(log_directory)
-    write_to_csv(results, output_csv_path)
-    print("Processing complete. Results saved to", output_csv_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Average fio bw/iops logs per host")
+    parser.add_argument("log_dir", nargs="?", default="/root/logs", help="directory searched recursively for fio *_bw_log.log / *_iops_log.log files")
+    parser.add_argument("output_csv", nargs="?", default="/root/output.csv", help="summary CSV path")
+    parser.add_argument("--window", type=float, default=WINDOW_MS / 1000,
+                        help="series window in seconds (default: %(default)s)")
+    parser.add_argument("--round", type=float, default=ROUND_MS / 1000,
+                        help="steady-state round length in seconds, a multiple of --window (default: %(default)s)")
+    parser.add_argument("--steady-state", action="store_true",
+                        help="average only from the start of the detected steady state")
+    parser.add_argument("--jobs", type=int, help="parallel log parsers (default: one per CPU)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"reparse every log instead of reusing results cached in {CACHE_PATH}")
+    parser.add_argument("--series", metavar="DIR", help="write per-window series CSVs to DIR")
+    parser.add_argument("--stats", metavar="FILE", help="write per-window percentiles and steady state to FILE")
+    parser.add_argument("--latency", metavar="FILE",
+                        help="write per-host and fleet latency percentiles from lat/clat/histogram logs to FILE")
+    parser.add_argument("--histograms", metavar="FILE", help="save the per-host latency histograms as JSON to FILE")
+    parser.add_argument("--merge", metavar="JSON", nargs="+", default=[],
+                        help="merge histograms saved by --histograms (e.g. from other runs) into the latency results")
+    args = parser.parse_args()
+
+    window_ms = int(args.window * 1000)
+    round_ms = int(args.round * 1000)
+    if window_ms <= 0 or round_ms % window_ms:
+        parser.error("--round must be a positive multiple of --window")
+
+    stats = analyze_logs(args.log_dir, window_ms, args.jobs, None if args.no_cache else CACHE_PATH)
+    write_to_csv(summarize(stats, args.steady_state, round_ms), args.output_csv)
+    if args.series:
+        write_series(stats, args.series)
+    if args.stats:
+        write_window_stats(stats, args.stats, round_ms)
+    if args.latency or args.histograms:
+        histograms = analyze_latency_logs(args.log_dir)
+        for saved in args.merge:
+            load_histograms(saved, histograms)
+        if args.histograms:
+            save_histograms(histograms, args.histograms)
+        if args.latency:
+            write_latency_percentiles(histograms, args.latency)
+    print("Processing complete. Results saved to", args.output_csv)
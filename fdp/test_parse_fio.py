@@ -0,0 +1,20 @@
+import parse_fio
+
+def write_log(path, value):
+    """A two-sample write bw log at a constant value"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"0, {value}, 1, 4096\n1000, {value}, 1, 4096\n")
+
+def test_jobs_in_one_directory_add_up(tmp_path):
+    write_log(tmp_path / "h1_job1_bw_log.log", 100)
+    write_log(tmp_path / "h1_job2_bw_log.log", 100)
+    results = parse_fio.calculate_averages(str(tmp_path), max_workers=1, cache_path=None)
+    assert results["h1"]["write_bw"] == 200
+
+def test_runs_in_subdirectories_are_reported_separately(tmp_path):
+    write_log(tmp_path / "run1" / "h1_bw_log.log", 100)
+    write_log(tmp_path / "run2" / "h1_bw_log.log", 100)
+    results = parse_fio.calculate_averages(str(tmp_path), max_workers=1, cache_path=None)
+    assert set(results) == {"run1/h1", "run2/h1"}
+    assert results["run1/h1"]["write_bw"] == 100
+    assert results["run2/h1"]["write_bw"] == 100
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+fio sweep
+Runs the block size x workload x I/O depth matrix against one or more devices. Each device
+gets its own worker running one fio at a time, so devices are tested in parallel without
+two tests sharing a drive. Rows are appended to the summary CSV as tests finish, which is
+what lets --resume pick up a partially finished sweep.
+
+With --adaptive, each (block size, workload) stops climbing the I/O depth list once the
+device saturates, bisects between the tested depths to find the knee, and reports it.
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZES = ["4k", "16k", "128k"]
+RW_PATTERNS = ["write", "read", "readwrite", "randread", "randwrite"]
+IO_DEPTHS = [1, 4, 16, 64, 128, 256]
+RUNTIME = 10  # seconds per test
+FIO_TIMEOUT_MARGIN = 120  # seconds on top of the runtime before a hung fio is killed
+CSV_FILE = "fio_summary.csv"
+KNEE_FILE = "fio_knees.csv"
+# Adaptive sweep: a depth saturates the device when it adds less than KNEE_THRESHOLD percent
+# IOPS over the previous depth while latency rises. The knee is the lowest depth within
+# KNEE_THRESHOLD percent of the best IOPS; --bisect-steps adds tests between listed depths
+# to narrow it down, at the cost of some of the time the skipped depths saved.
+KNEE_THRESHOLD = 10
+BISECT_STEPS = 0
+SUDO = [] if os.geteuid() == 0 else ["sudo"]
+
+# Summary CSV column -> type, used to read rows back for --resume
+RESULT_COLUMNS = {
+    "Device": str,
+    "Block Size": int,  # KiB
+    "Workload": str,
+    "I/O Depth": int,
+    "IOPS": float,
+    "Bandwidth (MB/s)": float,
+    "Latency (us)": float,
+}
+TEST_KEY = ["Device", "Block Size", "Workload", "I/O Depth"]
+KNEE_COLUMNS = ["Device", "Block Size", "Workload", "Knee I/O Depth", "IOPS", "Bandwidth (MB/s)", "Latency (us)",
+                "Saturated"]
+
+# Workloads whose reported latency is the read side
+READ_LATENCY_PATTERNS = {"read", "randread", "readwrite"}
+
+# Colors for summary
+LIGHT_MAGENTA = "\033[95m"
+LIGHT_BLUE = "\033[94m"
+LIGHT_YELLOW = "\033[93m"
+RESET = "\033[0m"
+COLORS = {"write": LIGHT_MAGENTA, "randwrite": LIGHT_MAGENTA, "read": LIGHT_BLUE, "randread": LIGHT_BLUE,
+          "readwrite": LIGHT_YELLOW}
+
+def size_kib(block_size):
+    """Convert a fio size like '4k' or '1m' to KiB"""
+    units = {"k": 1, "m": 1024, "g": 1024 ** 2}
+    suffix = block_size[-1].lower()
+    if suffix in units:
+        return int(block_size[:-1]) * units[suffix]
+    return int(block_size) // 1024
+
+def numa_cpulist(device):
+    """CPUs local to a block device's NUMA node as a cpulist string, or None if unknown"""
+    name = os.path.basename(os.path.realpath(device))
+    # NVMe namespaces hang off the controller, one level further down than SCSI disks
+    for path in (f"/sys/block/{name}/device/numa_node", f"/sys/block/{name}/device/device/numa_node"):
+        try:
+            with open(path) as f:
+                node = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if node < 0:
+            return None
+        try:
+            with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    return None
+
+def run_fio(device, block_size, rw, io_depth, runtime=RUNTIME, cpus=None):
+    """Run one fio test and return its parsed JSON output"""
+    command = SUDO + [
+        "fio",
+        f"--filename={device}",
+        f"--rw={rw}",
+        "--direct=1",
+        f"--bs={block_size}",
+        "--ioengine=io_uring",
+        f"--runtime={runtime}",
+        "--numjobs=1",
+        "--time_based",
+        "--group_reporting",
+        f"--name={rw}_{block_size}_iodepth{io_depth}",
+        f"--iodepth={io_depth}",
+        "--output-format=json",
+    ]
+    if cpus:
+        command.append(f"--cpus_allowed={cpus}")
+    result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            timeout=runtime + FIO_TIMEOUT_MARGIN)
+    # fio can print warnings ahead of the JSON document
+    return json.loads(result.stdout[result.stdout.index("{"):])
+
+def summarize_job(output, rw):
+    """Return (IOPS, bandwidth in MB/s, mean latency in usec) from fio JSON output"""
+    job = output["jobs"][0]
+    iops = job["read"]["iops"] + job["write"]["iops"]
+    bandwidth_mb = (job["read"]["bw"] + job["write"]["bw"]) * 1024 / 1000 / 1000
+    side = "read" if rw in READ_LATENCY_PATTERNS else "write"
+    latency_us = job[side]["lat_ns"]["mean"] / 1000
+    return iops, bandwidth_mb, latency_us
+
+def read_results(csv_file):
+    """Read a summary CSV back as typed rows, or [] if it does not exist yet"""
+    try:
+        with open(csv_file, newline="") as f:
+            reader = csv.DictReader(f)
+            # e.g. a fio_sweep.sh summary, which has no Device column
+            if reader.fieldnames and reader.fieldnames != list(RESULT_COLUMNS):
+                raise SystemExit(f"{csv_file} was not written by fio_sweep.py (columns {', '.join(reader.fieldnames)}); "
+                                 f"pass a different --output to resume")
+            return [{column: RESULT_COLUMNS[column](value) for column, value in row.items()} for row in reader]
+    except FileNotFoundError:
+        return []
+
+class ResultWriter:
+    """Appends result rows to the summary CSV from many device workers, flushing each row"""
+
+    def __init__(self, csv_file, append=False):
+        exists = append and os.path.exists(csv_file)
+        self.file = open(csv_file, "a" if exists else "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=list(RESULT_COLUMNS))
+        if not exists:
+            self.writer.writeheader()
+        self.lock = threading.Lock()
+
+    def write(self, row):
+        with self.lock:
+            self.writer.writerow(row)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def print_result(row):
+    color = COLORS.get(row["Workload"], "")
+    print(f"{color}{row['Device']} BS: {row['Block Size']}k, {row['Workload']}, I/O Depth: {row['I/O Depth']}, "
+          f"IOPS: {row['IOPS']:.2f}, BW (MB/s): {row['Bandwidth (MB/s)']:.2f}, "
+          f"Latency (us): {row['Latency (us)']:.2f}{RESET}", flush=True)
+
+def run_test(device, block_size, rw, io_depth, runtime, cpus):
+    """Run one test and return its result row, or None if fio failed"""
+    try:
+        output = run_fio(device, block_size, rw, io_depth, runtime, cpus)
+        iops, bandwidth_mb, latency_us = summarize_job(output, rw)
+    except subprocess.TimeoutExpired:
+        print(f"{device}: {rw} {block_size} QD{io_depth} timed out")
+        return None
+    except subprocess.CalledProcessError as e:
+        print(f"{device}: {rw} {block_size} QD{io_depth} failed: {e.stderr.strip()}")
+        return None
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"{device}: {rw} {block_size} QD{io_depth} failed: {e}")
+        return None
+    return {
+        "Device": device,
+        "Block Size": size_kib(block_size),
+        "Workload": rw,
+        "I/O Depth": io_depth,
+        "IOPS": iops,
+        "Bandwidth (MB/s)": bandwidth_mb,
+        "Latency (us)": latency_us,
+    }
+
+def saturated(previous, current, threshold=KNEE_THRESHOLD):
+    """True if current's extra depth bought less than threshold percent IOPS while latency rose"""
+    gain = (current["IOPS"] - previous["IOPS"]) / previous["IOPS"] * 100 if previous["IOPS"] else 0
+    return gain < threshold and current["Latency (us)"] > previous["Latency (us)"]
+
+def knee_bounds(results, threshold=KNEE_THRESHOLD):
+    """Return (lo, hi): the deepest tested depth below the knee target and the first at or above it"""
+    target = max(row["IOPS"] for row in results.values()) * (1 - threshold / 100)
+    depths = sorted(results)
+    hi = next(depth for depth in depths if results[depth]["IOPS"] >= target)
+    below = [depth for depth in depths if depth < hi]
+    return (below[-1] if below else None), hi
+
+def sweep_device(device, writer, done, block_sizes, rw_patterns, io_depths, runtime=RUNTIME, pin_numa=False,
+                 adaptive=False, threshold=KNEE_THRESHOLD, bisect_steps=BISECT_STEPS):
+    """Run the matrix on one device, reusing results in done (keyed by TEST_KEY)
+
+    Returns (new result rows, knee rows); knees are only found in adaptive mode.
+    """
+    cpus = numa_cpulist(device) if pin_numa else None
+    if cpus:
+        print(f"{device}: pinning fio to CPUs {cpus}")
+    rows, knees = [], []
+
+    def measure(block_size, rw, io_depth):
+        row = done.get((device, size_kib(block_size), rw, io_depth))
+        if row is None:
+            row = run_test(device, block_size, rw, io_depth, runtime, cpus)
+            if row is not None:
+                writer.write(row)
+                print_result(row)
+                rows.append(row)
+        return row
+
+    for block_size in block_sizes:
+        for rw in rw_patterns:
+            results = {}
+            previous = None
+            for index, io_depth in enumerate(io_depths):
+                row = measure(block_size, rw, io_depth)
+                if row is None:
+                    continue
+                results[io_depth] = row
+                if adaptive and previous is not None and saturated(previous, row, threshold):
+                    skipped = io_depths[index + 1:]
+                    if skipped:
+                        print(f"{device}: {rw} {block_size} saturated at QD{io_depth}, skipping QD{skipped}")
+                    break
+                previous = row
+            if not adaptive or not results:
+                continue
+
+            # Without the break above the device never saturated within io_depths
+            is_saturated = previous is not results[max(results)]
+            for _ in range(bisect_steps):
+                lo, hi = knee_bounds(results, threshold)
+                if lo is None or hi - lo <= 1:
+                    break
+                mid = (lo + hi) // 2
+                row = measure(block_size, rw, mid)
+                if row is None:
+                    break
+                results[mid] = row
+
+            _, knee = knee_bounds(results, threshold)
+            row = results[knee]
+            knees.append({
+                "Device": device,
+                "Block Size": row["Block Size"],
+                "Workload": rw,
+                "Knee I/O Depth": knee,
+                "IOPS": row["IOPS"],
+                "Bandwidth (MB/s)": row["Bandwidth (MB/s)"],
+                "Latency (us)": row["Latency (us)"],
+                "Saturated": is_saturated,
+            })
+    return rows, knees
+
+def write_knees(knees, knee_file):
+    with open(knee_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=KNEE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(knees)
+
+def print_summary(rows, columns=list(RESULT_COLUMNS), title="Final Summary"):
+    """Print rows as an aligned Markdown table, one color per workload"""
+    cells = [[f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print(f"\n{title}:")
+    print("| " + " | ".join(c.ljust(w) for c, w in zip(columns, widths)) + " |")
+    print("|" + "|".join("-" * (w + 2) for w in widths) + "|")
+    for row, cell in zip(rows, cells):
+        color = COLORS.get(row["Workload"], "")
+        print("| " + " | ".join(f"{color}{v.ljust(w)}{RESET}" for v, w in zip(cell, widths)) + " |")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep block size, workload and I/O depth with fio across devices")
+    parser.add_argument("devices", nargs="+", help="block devices to test, e.g. /dev/nvme1n1 /dev/nvme2n1")
+    parser.add_argument("--block-sizes", nargs="+", default=BLOCK_SIZES, help="default: %(default)s")
+    parser.add_argument("--patterns", nargs="+", default=RW_PATTERNS, help="default: %(default)s")
+    parser.add_argument("--io-depths", nargs="+", type=int, default=IO_DEPTHS, help="default: %(default)s")
+    parser.add_argument("--runtime", type=int, default=RUNTIME, help="seconds per test (default: %(default)s)")
+    parser.add_argument("--output", default=CSV_FILE, help="summary CSV (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the rows already in --output and only run the missing tests")
+    parser.add_argument("--numa", action="store_true",
+                        help="pin each device's fio to the CPUs of the device's NUMA node")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="stop raising I/O depth once the device saturates and bisect for the knee")
+    parser.add_argument("--knee-threshold", type=float, default=KNEE_THRESHOLD,
+                        help="percent IOPS gain below which a deeper queue counts as saturated (default: %(default)s)")
+    parser.add_argument("--bisect-steps", type=int, default=BISECT_STEPS,
+                        help="extra tests per (bs, workload) to narrow the knee (default: %(default)s)")
+    parser.add_argument("--knee-output", default=KNEE_FILE, help="knee CSV with --adaptive (default: %(default)s)")
+    args = parser.parse_args()
+    args.io_depths = sorted(set(args.io_depths))
+    return args
+
+def main():
+    args = parse_args()
+
+    previous = read_results(args.output) if args.resume else []
+    done = {tuple(row[c] for c in TEST_KEY): row for row in previous}
+    if done:
+        print(f"Resuming: {len(done)} tests already in {args.output}")
+
+    writer = ResultWriter(args.output, append=args.resume)
+    try:
+        with ThreadPoolExecutor(max_workers=len(args.devices)) as executor:
+            futures = [executor.submit(sweep_device, device, writer, done, args.block_sizes, args.patterns,
+                                       args.io_depths, args.runtime, args.numa, args.adaptive,
+                                       args.knee_threshold, args.bisect_steps)
+                       for device in args.devices]
+            results = [future.result() for future in futures]
+    finally:
+        writer.close()
+
+    print_summary(previous + [row for rows, _ in results for row in rows])
+    if args.adaptive:
+        knees = [knee for _, device_knees in results for knee in device_knees]
+        write_knees(knees, args.knee_output)
+        print_summary(knees, KNEE_COLUMNS, "Knees")
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,150 @@
 import streamlit as st
-import json
-import gzip
-import io
-import tarfile
+import multiprocessing
+import operator
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import altair as alt
+from cdi_ingest import DRIVE_COLUMNS, parse_archive
 
-def extract_json_from_gzip(uploaded_file):
-    """Extract and parse multiple JSON files from a gzipped tar archive."""
-    drives_data = []
+# Archives are decompressed and parsed in parallel, one per worker process
+MAX_ARCHIVE_WORKERS = min(8, os.cpu_count() or 1)
 
-    # Create a BytesIO object from the uploaded file
-    bytes_io = io.BytesIO(uploaded_file.read())
-
-    # Open as tar archive
-    try:
-        with tarfile.open(fileobj=bytes_io, mode='r:gz') as tar:
-            # Iterate through all files in the archive
-            for member in tar.getmembers():
-                if member.name.endswith('.json'):
-                    # Extract the JSON file
-                    f = tar.extractfile(member)
-                    if f is not None:
-                        try:
-                            # Parse JSON content
-                            content = json.loads(f.read().decode('utf-8'))
-                            drives_data.append(content)
-                        except Exception as e:
-                            st.warning(f"Failed to parse {member.name}: {str(e)}")
-    except Exception as e:
-        st.error(f"Error processing archive: {str(e)}")
+def process_archives(uploaded_files, attribute_ids, max_workers=MAX_ARCHIVE_WORKERS):
+    """Parse and flatten uploaded archives concurrently in a process pool, showing progress per archive."""
+    drives_data = []
+    results = [None] * len(uploaded_files)
+    progress = st.progress(0.0, text=f"Processing 0/{len(uploaded_files)} archives")
+    status = [st.empty() for _ in uploaded_files]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Workers stream each archive from disk rather than receiving it pickled
+        paths = []
+        for i, uploaded_file in enumerate(uploaded_files):
+            path = os.path.join(tmp_dir, f"{i}.tar.gz")
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(uploaded_file, f)
+            paths.append(path)
+            status[i].info(f"Queued: {uploaded_file.name}")
+
+        # spawn rather than fork: the dashboard process runs Streamlit's server threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(paths))), mp_context=context) as executor:
+            futures = {executor.submit(parse_archive, path, attribute_ids): i for i, path in enumerate(paths)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                name = uploaded_files[i].name
+                try:
+                    records, errors = future.result()
+                except Exception as e:
+                    records, errors = [], [f"Error processing archive: {str(e)}"]
+                for error in errors:
+                    st.warning(f"{name}: {error}")
+                if records:
+                    status[i].success(f"Successfully processed: {name} ({len(records)} drives)")
+                else:
+                    status[i].error(f"Failed to process: {name}")
+                results[i] = records
+                progress.progress(done / len(paths), text=f"Processing {done}/{len(paths)} archives")
 
+    # Merge in upload order so the fleet summary does not depend on completion order
+    for records in results:
+        drives_data.extend(records)
     return drives_data
 
-def calculate_tbw(data):
-    """Calculate Terabytes Written from SMART data."""
-    try:
-        if 'ata_smart_attributes' in data:
-            for attr in data['ata_smart_attributes']['table']:
-                if attr['id'] == 241:  # Total_LBAs_Written
-                    return (attr['raw']['value'] * 512) / (1024**4)  # Convert to TBW
-    except Exception as e:
-        st.warning(f"Error calculating TBW: {str(e)}")
-    return 0
-
-def analyze_drive_health(data):
-    """Analyze drive health based on specified criteria."""
-    issues = []
-    is_failed = False
-
-    try:
-        # Basic SMART status check
-        if not data.get('smart_status', {}).get('passed', True):
-            issues.append("Failed SMART status")
-            is_failed = True
-
-        # Temperature checks
-        temp_data = data.get('temperature', {})
-        current_temp = temp_data.get('current')
-        max_temp = temp_data.get('lifetime_max')
-
-        if current_temp and max_temp:
-            if max_temp > 70:  # General threshold for most drives
-                issues.append(f"Maximum temperature exceeded: {max_temp}°C")
-                is_failed = True
-
-        # Check SMART attributes
-        if 'ata_smart_attributes' in data:
-            for attr in data['ata_smart_attributes']['table']:
-                # Reallocated Sectors check
-                if attr['id'] == 5 and attr['raw']['value'] > 10:
-                    issues.append(f"Reallocated sectors: {attr['raw']['value']}")
-                    is_failed = True
-
-                # Pending Sectors check
-                elif attr['id'] == 197 and attr['raw']['value'] > 10:
-                    issues.append(f"Pending sectors: {attr['raw']['value']}")
-                    is_failed = True
-
-                # Uncorrectable Errors
-                elif attr['id'] == 187 and attr['raw']['value'] > 0:
-                    issues.append(f"Uncorrectable errors: {attr['raw']['value']}")
-                    is_failed = True
-
-        # Calculate workload
-        tbw = calculate_tbw(data)
-        poh = data.get('power_on_time', {}).get('hours', 0)
-
-        if poh > 0:
-            tb_per_year = (tbw * 8760) / poh  # Convert to TB/year
-            if tb_per_year > 550:
-                issues.append(f"Heavy workload: {tb_per_year:.1f} TB/year")
-
-        return is_failed, issues, tbw
-
-    except Exception as e:
-        st.warning(f"Error analyzing drive health: {str(e)}")
-        return True, ["Error analyzing drive health"], 0
+# Health rules, evaluated as vectorized column expressions over the whole fleet.
+# 'column' is an ATA attribute ID (compared on its raw value) or a derived
+# per-drive column from flatten_drives; 'fails' marks the drive as Failed,
+# otherwise the rule only adds an issue.
+HEALTH_RULES = [
+    {'column': 'smart_failed', 'op': '>', 'threshold': 0,
+     'message': "Failed SMART status", 'fails': True},
+    {'column': 'max_temperature', 'op': '>', 'threshold': 70,  # General threshold for most drives
+     'message': "Maximum temperature exceeded: {value}°C", 'fails': True},
+    {'column': 5, 'op': '>', 'threshold': 10,
+     'message': "Reallocated sectors: {value}", 'fails': True},
+    {'column': 187, 'op': '>', 'threshold': 0,
+     'message': "Uncorrectable errors: {value}", 'fails': True},
+    {'column': 197, 'op': '>', 'threshold': 10,
+     'message': "Pending sectors: {value}", 'fails': True},
+    {'column': 'tb_per_year', 'op': '>', 'threshold': 550,
+     'message': "Heavy workload: {value:.1f} TB/year", 'fails': False},
+]
+
+RULE_OPS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+TBW_ATTRIBUTE = 241  # Total_LBAs_Written
+
+def rule_attribute_ids(rules=HEALTH_RULES):
+    """ATA attribute IDs the rules and the TBW calculation need from each drive."""
+    return {rule['column'] for rule in rules if isinstance(rule['column'], int)} | {TBW_ATTRIBUTE}
+
+def flatten_drives(drives_data, attribute_ids):
+    """Build the fleet table from flatten_record results: identity columns plus one raw-value column per attribute ID."""
+    values = [drive for drive, _ in drives_data]
+    drives = pd.DataFrame(values, columns=list(DRIVE_COLUMNS)) if values else pd.DataFrame(columns=list(DRIVE_COLUMNS))
+    drives['max_temperature'] = pd.array([drive[DRIVE_COLUMNS.index('max_temperature')] for drive in values])
+
+    raw = pd.DataFrame([raw for _, raw in drives_data], index=drives.index, columns=sorted(attribute_ids))
+    return drives.join(raw.astype('Int64'))
+
+def evaluate_fleet_health(drives_data, rules=HEALTH_RULES):
+    """Evaluate health rules for the whole fleet at once, returning the summary table and fleet metrics.
+
+    drives_data are flatten_record results for at least the rule_attribute_ids(rules) attributes.
+    """
+    fleet = flatten_drives(drives_data, rule_attribute_ids(rules))
+
+    # Calculate workload
+    fleet['TBW'] = (fleet[TBW_ATTRIBUTE].fillna(0).astype('float64') * 512) / (1024**4)  # Convert to TBW
+    poh = fleet['POH'].astype('float64')
+    fleet['tb_per_year'] = (fleet['TBW'] * 8760 / poh.where(poh > 0)).astype('Float64')  # Convert to TB/year
+
+    is_failed = fleet['error'].copy()
+    issue_parts = {}
+    for i, rule in enumerate(rules):
+        values = fleet[rule['column']]
+        flagged = RULE_OPS[rule['op']](values, rule['threshold']).fillna(False).astype(bool) & ~fleet['error']
+        if rule['fails']:
+            is_failed |= flagged
+        # Only flagged drives need a message, so formatting stays off the hot path
+        issue_parts[i] = values[flagged].map(lambda value, message=rule['message']: message.format(value=value))
+
+    issues = pd.DataFrame(issue_parts, index=fleet.index).stack().dropna().groupby(level=0).agg(', '.join)
+    issues = issues.reindex(fleet.index, fill_value='None')
+    issues[fleet['error']] = "Error analyzing drive health"
+
+    fleet['TBW'] = fleet['TBW'].where(~fleet['error'], 0.0)
+    summary = pd.DataFrame({
+        'Model': fleet['Model'],
+        'Serial': fleet['Serial'],
+        'Firmware': fleet['Firmware'],
+        'Status': np.where(is_failed, 'Failed', 'Healthy'),
+        'POH': fleet['POH'],
+        'TBW': fleet['TBW'].round(2),
+        'Temperature': fleet['Temperature'],
+        'Issues': issues,
+    })
+
+    # Calculate MTBF and AFR
+    total_drives = len(fleet)
+    failed_drives = int(is_failed.sum())
+    total_poh = poh.sum()
+    mtbf_hours = total_poh / (failed_drives if failed_drives > 0 else 1)
+    afr = (failed_drives / total_drives) * (8760 / (total_poh / total_drives)) * 100 if total_drives > 0 and total_poh > 0 else 0
+
+    metrics = {
+        'total_drives': total_drives,
+        'failed_drives': failed_drives,
+        'total_tbw': fleet['TBW'].sum(),
+        'mtbf_hours': mtbf_hours,
+        'afr': afr,
+    }
+    return summary, metrics
 
 def main():
     st.title("Drive Health Analysis Dashboard")
@@ -107,17 +154,8 @@ def main():
                                     accept_multiple_files=True)
 
     if uploaded_files:
-        drives_data = []
-
-        # Process each uploaded file
-        with st.spinner('Processing files...'):
-            for uploaded_file in uploaded_files:
-                data = extract_json_from_gzip(uploaded_file)
-                if data:
-                    drives_data.extend(data)
-                    st.success(f"Successfully processed: {uploaded_file.name}")
-                else:
-                    st.error(f"Failed to process: {uploaded_file.name}")
+        # Process the uploaded archives in parallel
+        drives_data = process_archives(uploaded_files, rule_attribute_ids())
 
         if not drives_data:
             st.error("No valid SMART data found in uploaded files")
@@ -125,40 +163,12 @@ def main():
 
         # Summary statistics
         st.header("Fleet Summary")
-        total_drives = len(drives_data)
-        failed_drives = 0
-        total_tbw = 0
-        drive_summaries = []
-
-        for data in drives_data:
-            try:
-                model = data.get('model_name', 'Unknown')
-                serial = data.get('serial_number', 'Unknown')
-                firmware = data.get('firmware_version', 'Unknown')
-                is_failed, issues, tbw = analyze_drive_health(data)
-
-                if is_failed:
-                    failed_drives += 1
-
-                total_tbw += tbw
-
-                drive_summaries.append({
-                    'Model': model,
-                    'Serial': serial,
-                    'Firmware': firmware,
-                    'Status': 'Failed' if is_failed else 'Healthy',
-                    'POH': data.get('power_on_time', {}).get('hours', 0),
-                    'TBW': round(tbw, 2),
-                    'Temperature': data.get('temperature', {}).get('current', 'N/A'),
-                    'Issues': ', '.join(issues) if issues else 'None'
-                })
-            except Exception as e:
-                st.warning(f"Error processing drive {serial}: {str(e)}")
-
-        # Calculate MTBF and AFR
-        total_poh = sum(data.get('power_on_time', {}).get('hours', 0) for data in drives_data)
-        mtbf_hours = total_poh / (failed_drives if failed_drives > 0 else 1)
-        afr = (failed_drives / total_drives) * (8760 / (total_poh / total_drives)) * 100 if total_drives > 0 and total_poh > 0 else 0
+        df_summary, fleet_metrics = evaluate_fleet_health(drives_data)
+        total_drives = fleet_metrics['total_drives']
+        failed_drives = fleet_metrics['failed_drives']
+        total_tbw = fleet_metrics['total_tbw']
+        mtbf_hours = fleet_metrics['mtbf_hours']
+        afr = fleet_metrics['afr']
 
         # Display summary metrics
         col1, col2, col3, col4, col5, col6 = st.columns(6)
@@ -176,9 +186,6 @@ def main():
         with col6:
             st.metric("AFR", f"{afr:.2f}%")
 
-        # Convert to DataFrame for better display
-        df_summary = pd.DataFrame(drive_summaries)
-
         # Show failed drives first
         st.header("Failed Drives")
         failed_df = df_summary[df_summary['Status'] == 'Failed']
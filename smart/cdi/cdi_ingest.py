@@ -0,0 +1,77 @@
+"""
+SMART archive ingest for the CDI health dashboard.
+Kept free of Streamlit so archives can be parsed in worker processes.
+"""
+
+import json
+import tarfile
+
+def iter_drive_records(fileobj, on_error=None):
+    """Yield drive records from a gzipped tar stream as each JSON member is decompressed."""
+    # 'r|gz' reads the archive strictly forward: no seeking, no member index,
+    # and only the current member is held in memory
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.endswith('.json'):
+                continue
+            f = tar.extractfile(member)
+            if f is None:
+                continue
+            try:
+                # Parse JSON content
+                content = json.loads(f.read().decode('utf-8'))
+            except Exception as e:
+                if on_error is not None:
+                    on_error(f"Failed to parse {member.name}: {str(e)}")
+                continue
+            yield content
+
+# Per-drive values flatten_record extracts, in order
+DRIVE_COLUMNS = ('Model', 'Serial', 'Firmware', 'POH', 'Temperature', 'smart_failed', 'max_temperature', 'error')
+
+def flatten_record(data, attribute_ids):
+    """Reduce one drive record to (DRIVE_COLUMNS values, {attribute ID: raw value} for attribute_ids)."""
+    temp_data = data.get('temperature', {})
+    current_temp = temp_data.get('current')
+    max_temp = temp_data.get('lifetime_max')
+
+    raw = {}
+    error = False
+    try:
+        for attr in data.get('ata_smart_attributes', {}).get('table', []):
+            if attr['id'] in attribute_ids:
+                # First occurrence wins, matching a linear scan of the attribute table
+                raw.setdefault(attr['id'], attr['raw']['value'])
+    except (KeyError, TypeError, AttributeError):
+        error = True
+
+    values = (
+        data.get('model_name', 'Unknown'),
+        data.get('serial_number', 'Unknown'),
+        data.get('firmware_version', 'Unknown'),
+        data.get('power_on_time', {}).get('hours', 0),
+        temp_data.get('current', 'N/A'),
+        not data.get('smart_status', {}).get('passed', True),
+        # Lifetime max only counts when the drive also reports a current temperature
+        max_temp if current_temp and max_temp else None,
+        error,
+    )
+    return values, raw
+
+def parse_archive(path, attribute_ids):
+    """Flatten every drive record in one archive on disk, returning (flatten_record results, error messages).
+
+    Only the small per-drive tuples leave the worker; each record's full JSON is dropped once flattened.
+    """
+    drives = []
+    errors = []
+    try:
+        with open(path, 'rb') as f:
+            for content in iter_drive_records(f, on_error=errors.append):
+                try:
+                    drives.append(flatten_record(content, attribute_ids))
+                except AttributeError as e:
+                    errors.append(f"Unexpected drive record layout: {str(e)}")
+    except Exception as e:
+        errors.append(f"Error processing archive: {str(e)}")
+    return drives, errors
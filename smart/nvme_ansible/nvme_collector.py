@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+NVMe SMART collector
+Runs on each host and reads smart-log, id-ctrl and id-ns from every NVMe namespace
+concurrently, writing one gzip NDJSON batch with a line per device. Each line has the
+same fields as the per-device JSON files nvme_smart_logs.yml used to write, so the
+dashboard reads either. Standard library only, so Ansible can run it with the system python3.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import socket
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+COMMAND_TIMEOUT = 30  # seconds per nvme call
+MAX_WORKERS = 32
+
+def run_nvme_command(args):
+    """Run an nvme-cli command and return its JSON output, or None if it failed"""
+    command = ["nvme"] + args + ["--output-format=json"]
+    try:
+        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=COMMAND_TIMEOUT)
+        return json.loads(result.stdout)
+    except subprocess.CalledProcessError as e:
+        print(f"Error running {' '.join(command)}: {e.stderr.decode().strip()}")
+    except subprocess.TimeoutExpired:
+        print(f"Timed out running {' '.join(command)}")
+    except (OSError, ValueError) as e:
+        print(f"Error running {' '.join(command)}: {e}")
+    return None
+
+def list_namespaces():
+    # NVMe namespace block devices, e.g. /dev/nvme0n1, the same devices `nvme list` shows
+    names = [name for name in os.listdir("/dev") if re.fullmatch(r"nvme\d+n\d+", name)]
+    return [f"/dev/{name}" for name in sorted(names, key=lambda name: [int(n) for n in re.findall(r"\d+", name)])]
+
+def collect_device(device, hostname, timestamp):
+    """Read one namespace's log pages into a record, or None if it has no SMART log"""
+    smart_log = run_nvme_command(["smart-log", device])
+    if not smart_log:
+        return None
+    id_ctrl = run_nvme_command(["id-ctrl", device]) or {}
+    id_ns = run_nvme_command(["id-ns", device]) or {}
+    return {
+        "hostname": hostname,
+        "device": device,
+        "serial_number": str(id_ctrl.get("sn", "UNKNOWN")).strip(),
+        "timestamp": timestamp,
+        "smart_log": smart_log,
+        "id_ctrl": id_ctrl,
+        "id_ns": id_ns,
+    }
+
+def collect(hostname, devices=None):
+    """Collect every device concurrently, returning records in device order"""
+    devices = list_namespaces() if devices is None else devices
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(devices), MAX_WORKERS)) as executor:
+        records = executor.map(collect_device, devices, [hostname] * len(devices), [timestamp] * len(devices))
+        return [record for record in records if record is not None]
+
+def write_batch(records, output):
+    """Write records as gzip NDJSON, replacing output atomically"""
+    tmp = f"{output}.tmp"
+    with gzip.open(tmp, "wt") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    os.replace(tmp, output)
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect NVMe SMART data from every namespace into one NDJSON batch")
+    parser.add_argument("--hostname", default=socket.gethostname(), help="hostname to record (default: %(default)s)")
+    parser.add_argument("--output", help="batch path (default: ./{hostname}_{epoch}.ndjson.gz)")
+    parser.add_argument("devices", nargs="*", help="namespaces to read (default: every /dev/nvmeXnY)")
+    args = parser.parse_args()
+
+    records = collect(args.hostname, args.devices or None)
+    output = args.output or f"{args.hostname}_{int(datetime.now().timestamp())}.ndjson.gz"
+    write_batch(records, output)
+    print(f"Collected SMART logs from {len(records)} NVMe devices on {args.hostname} into {output}")
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import json
 import os
-import glob
+import sqlite3
+import uuid
 from datetime import datetime, timedelta
 import numpy as np
+from nvme_ingest import BATCH_SUFFIX, RECORD_COLUMNS, RECORD_DTYPES, iter_parsed_files, load_full_smart_data
 
 # Page config
 st.set_page_config(
@@ -23,74 +24,152 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def load_smart_data(log_dir="/opt/nvme_smart_logs"):
-    """Load all SMART log JSON files"""
-    json_files = glob.glob(os.path.join(log_dir, "*.json"))
-
-    if not json_files:
-        st.error(f"No JSON files found in {log_dir}")
+# Ingest cache: one row per parsed record (a JSON file, or a line of an NDJSON batch),
+# invalidated per file by mtime + size
+CACHE_PATH = os.path.expanduser("~/.cache/nvme_dashboard/ingest_cache.sqlite")
+CACHE_SCHEMA_VERSION = 3
+
+def open_ingest_cache(cache_path=CACHE_PATH):
+    """Open the SQLite ingest cache, rebuilding it if the schema version changed"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        conn = sqlite3.connect(cache_path)
+    except (OSError, sqlite3.Error) as e:
+        st.warning(f"Ingest cache unavailable ({e}), parsing all files")
+        conn = sqlite3.connect(":memory:")
+
+    if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS records")
+        conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+
+    # has_smart = 0 (line -1) marks files without a SMART log so they are not re-read either
+    columns = ', '.join(c for c in RECORD_COLUMNS if c not in ('file_path', 'line'))
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS records (
+            file_path TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            log_dir TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            has_smart INTEGER NOT NULL,
+            {columns},
+            PRIMARY KEY (file_path, line)
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS records_log_dir ON records (log_dir)")
+    return conn
+
+def load_smart_data(log_dir="/opt/nvme_smart_logs", cache_path=CACHE_PATH):
+    """Load all SMART log JSON files, parsing only files that are new or changed since the last load"""
+    log_dir = os.path.abspath(log_dir)
+    try:
+        with os.scandir(log_dir) as entries:
+            file_stats = {}
+            for entry in entries:
+                if entry.name.endswith(('.json', BATCH_SUFFIX)) and entry.is_file():
+                    stat = entry.stat()
+                    file_stats[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        file_stats = {}
+
+    if not file_stats:
+        st.error(f"No JSON or {BATCH_SUFFIX} files found in {log_dir}")
         return pd.DataFrame()
 
-    data = []
-    for file_path in json_files:
-        try:
-            with open(file_path, 'r') as f:
-                log_data = json.load(f)
-                if 'smart_log' in log_data and log_data['smart_log']:
-                    smart_data = log_data['smart_log']
-                    id_ctrl_data = log_data.get('id_ctrl', {})
-                    id_ns_data = log_data.get('id_ns', {})
-
-                    # Extract model and capacity info
-                    model_number = id_ctrl_data.get('mn', 'Unknown').strip() if id_ctrl_data else 'Unknown'
-                    # Use TNVMCAP (Total NVM Capacity) field from id_ctrl which gives capacity directly in bytes
-                    capacity_bytes = id_ctrl_data.get('tnvmcap', 0) if id_ctrl_data else 0
-                    capacity_tb = capacity_bytes / (1000**4) if capacity_bytes > 0 else 0  # Convert to decimal TB
-
-                    # Extract key metrics from SMART log
-                    record = {
-                        'hostname': log_data.get('hostname', 'Unknown'),
-                        'device': log_data.get('device', 'Unknown'),
-                        'serial_number': log_data.get('serial_number', 'Unknown'),
-                        'timestamp': log_data.get('timestamp', ''),
-                        'file_path': file_path,
-
-                        # Drive identification
-                        'model_number': model_number,
-                        'capacity_tb': capacity_tb,
-                        'firmware_rev': id_ctrl_data.get('fr', 'Unknown').strip() if id_ctrl_data else 'Unknown',
-
-                        # Critical metrics
-                        'critical_warning': smart_data.get('critical_warning', 0),
-                        'avail_spare': smart_data.get('avail_spare', 0),
-                        'spare_thresh': smart_data.get('spare_thresh', 0),
-                        'percent_used': smart_data.get('percent_used', 0),
-                        'power_on_hours': smart_data.get('power_on_hours', 0),
-                        'unsafe_shutdowns': smart_data.get('unsafe_shutdowns', 0),
-                        'media_errors': smart_data.get('media_errors', 0),
-                        'num_err_log_entries': smart_data.get('num_err_log_entries', 0),
-
-                        # Temperature (convert from Kelvin to Celsius if needed)
-                        'temperature': smart_data.get('temperature', 0) - 273.15 if smart_data.get('temperature', 0) > 200 else smart_data.get('temperature', 0),
-                        'temp_sensor_1': smart_data.get('temp_sensor_1', 0) - 273.15 if smart_data.get('temp_sensor_1', 0) > 200 else smart_data.get('temp_sensor_1', 0),
-                        'temp_sensor_2': smart_data.get('temp_sensor_2', 0) - 273.15 if smart_data.get('temp_sensor_2', 0) > 200 else smart_data.get('temp_sensor_2', 0),
-
-                        # Data written/read (convert to TB)
-                        # NVMe spec: data_units_written is in thousands, so multiply by 1000, then * 512 bytes, then convert to decimal TB
-                        'data_units_written': (smart_data.get('data_units_written', 0) * 1000 * 512) / (1000**4),  # Convert to decimal TB
-                        'data_units_read': (smart_data.get('data_units_read', 0) * 1000 * 512) / (1000**4),      # Convert to decimal TB
-                        'host_writes': (smart_data.get('host_writes', 0) * 1000 * 512) / (1000**4),             # Convert to decimal TB
-                        'host_reads': (smart_data.get('host_reads', 0) * 1000 * 512) / (1000**4),               # Convert to decimal TB
-
-                        # Full SMART data for advanced mode
-                        'full_smart_data': smart_data
-                    }
-                    data.append(record)
-        except Exception as e:
-            st.warning(f"Error reading {file_path}: {e}")
-
+    conn = open_ingest_cache(cache_path)
+    try:
+        with conn:
+            cached = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in conn.execute(
+                    "SELECT file_path, mtime_ns, size FROM records WHERE log_dir = ?", (log_dir,))
+            }
+
+            removed = [(path,) for path in cached if path not in file_stats]
+            conn.executemany("DELETE FROM records WHERE file_path = ?", removed)
+
+            columns = ['log_dir', 'mtime_ns', 'size', 'has_smart'] + RECORD_COLUMNS
+            insert_sql = (f"INSERT INTO records ({', '.join(columns)}) "
+                          f"VALUES ({', '.join('?' * len(columns))})")
+            stale = [path for path, key in file_stats.items() if cached.get(path) != key]
+            for file_path, records, error in iter_parsed_files(stale):
+                conn.execute("DELETE FROM records WHERE file_path = ?", (file_path,))
+                if error is not None:
+                    st.warning(f"Error reading {file_path}: {error}")
+                    continue
+                mtime_ns, size = file_stats[file_path]
+                if not records:
+                    placeholder = [None] * len(RECORD_COLUMNS)
+                    placeholder[RECORD_COLUMNS.index('file_path')] = file_path
+                    placeholder[RECORD_COLUMNS.index('line')] = -1
+                    conn.execute(insert_sql, (log_dir, mtime_ns, size, 0, *placeholder))
+                conn.executemany(insert_sql, [(log_dir, mtime_ns, size, 1, *record) for record in records])
+
+        rows = conn.execute(
+            f"SELECT {', '.join(RECORD_COLUMNS)} FROM records "
+            "WHERE log_dir = ? AND has_smart = 1 ORDER BY file_path, line", (log_dir,)).fetchall()
+    finally:
+        conn.close()
+
+    return frame_from_rows(rows)
+
+def frame_from_rows(rows):
+    """Build a typed, column-oriented DataFrame from record tuples"""
+    columns = list(zip(*rows)) or [()] * len(RECORD_COLUMNS)
+    data = {}
+    for name, values in zip(RECORD_COLUMNS, columns):
+        dtype = RECORD_DTYPES[name]
+        if dtype == 'category':
+            data[name] = pd.Categorical(values)
+        elif dtype.startswith('datetime'):
+            data[name] = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601')
+        elif dtype == 'object':
+            data[name] = np.array(values, dtype=object)
+        else:
+            data[name] = np.array(values, dtype=dtype)
     return pd.DataFrame(data)
 
+DRIVE_KEY = ['hostname', 'serial_number']
+
+def build_views(df):
+    """Sort snapshots once by drive and time, and derive the latest-per-drive view and per-drive index"""
+    df = df.sort_values(DRIVE_KEY + ['timestamp'], kind='stable', na_position='first', ignore_index=True)
+
+    # Change since the previous snapshot of the same drive
+    by_drive = df.groupby(DRIVE_KEY, observed=True, sort=False)
+    df['data_units_written_delta'] = by_drive['data_units_written'].diff()
+    df['percent_used_delta'] = by_drive['percent_used'].diff()
+    df['temperature_delta'] = by_drive['temperature'].diff()
+
+    # Rows are sorted by time within each drive, so the last row per group is the latest snapshot
+    latest_df = by_drive.tail(1).reset_index(drop=True)
+    drive_index = by_drive.indices
+    return df, latest_df, drive_index
+
+def capacity_label(capacity_tb):
+    """Capacity bucket shown in the capacity filter"""
+    return f"{capacity_tb:.1f} TB"
+
+def build_filter_index(df):
+    """Row positions for every filter value, so applying a filter is a lookup instead of a scan"""
+    # Unknown (zero) capacities get no bucket and are dropped by groupby
+    capacity_labels = df['capacity_tb'].map(capacity_label).where(df['capacity_tb'] > 0)
+    return {
+        'model_number': df.groupby('model_number', observed=True).indices,
+        'hostname': df.groupby('hostname', observed=True).indices,
+        'capacity': capacity_labels.groupby(capacity_labels).indices,
+    }
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def filter_positions(_filter_index, data_version, model, capacity, host):
+    """Sorted row positions matching the selected filters, or None when nothing is filtered"""
+    positions = None
+    for column, value in (('model_number', model), ('capacity', capacity), ('hostname', host)):
+        if value == 'All':
+            continue
+        rows = _filter_index[column].get(value, np.array([], dtype=np.intp))
+        positions = rows if positions is None else np.intersect1d(positions, rows, assume_unique=True)
+    return positions
+
 def interpret_critical_warning(warning_value):
     """Interpret critical warning bits"""
     warnings = []
@@ -118,6 +197,93 @@ def format_time_duration(hours):
         years = hours / (24 * 365)
         return f"{years:.2f} years ({hours:,.0f} hours)"
 
+HISTOGRAM_BINS = 50
+PERCENTILES = [50, 90, 99]
+
+def top_n_drives(df, column, n):
+    """The n rows with the highest value in column, highest first, without sorting the whole frame"""
+    values = df[column].to_numpy(dtype=float, na_value=-np.inf)
+    positions = np.argpartition(values, -n)[-n:] if len(values) > n else np.arange(len(values))
+    positions = positions[np.argsort(-values[positions], kind='stable')]
+    return df.take(positions)
+
+def distribution_figure(values, title, thresholds=()):
+    """Fleet-wide histogram of a metric with percentile markers, binned server-side"""
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+                           hovertemplate="%{x:.1f}: %{y} drives<extra></extra>"))
+    fig.update_layout(title=title, yaxis_title="Drives", bargap=0)
+    if len(values):
+        for pct, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            fig.add_vline(x=value, line_dash="dot", line_color="gray", annotation_text=f"p{pct}")
+    for value, color, text in thresholds:
+        fig.add_vline(x=value, line_dash="dash", line_color=color, annotation_text=text)
+    return fig
+
+def drive_bar_figure(df, column, title, thresholds=(), **bar_args):
+    """One bar per drive"""
+    # Plain strings so the axis only carries the drives being drawn, not every category
+    df = df.assign(serial_number=df['serial_number'].astype(str))
+    fig = px.bar(df, x='serial_number', y=column,
+                 hover_data=['hostname', 'device', 'model_number'],
+                 title=title, **bar_args)
+    fig.update_xaxes(tickangle=45)
+    for value, color, text in thresholds:
+        fig.add_hline(y=value, line_dash="dash", line_color=color, annotation_text=text)
+    return fig
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def drive_metric_figures(_df, view_key, column, title, top_n, thresholds, bar_args):
+    """Figures for one metric, memoized per data version and filter selection"""
+    if len(_df) <= top_n:
+        return [drive_bar_figure(_df, column, f"{title} by Drive", thresholds, **bar_args)]
+
+    return [
+        distribution_figure(_df[column].to_numpy(dtype=float), f"{title} across {len(_df):,} Drives", thresholds),
+        drive_bar_figure(top_n_drives(_df, column, top_n), column, f"Top {top_n} Drives by {title}",
+                         thresholds, **bar_args),
+    ]
+
+def show_drive_metric(df, view_key, column, title, top_n, thresholds=(), **bar_args):
+    """Exact bars for small fleets; otherwise a fleet histogram plus bars for the top_n highest drives"""
+    for fig in drive_metric_figures(df, view_key, column, title, top_n, tuple(thresholds), bar_args):
+        st.plotly_chart(fig, use_container_width=True)
+
+TIME_SERIES_METRICS = {
+    'Total Bytes Written (TB)': 'data_units_written',
+    'Percent Used': 'percent_used',
+    'Temperature (°C)': 'temperature',
+}
+
+def show_time_series(drives_df):
+    """Plot SMART metrics over time for the selected drives, using the precomputed per-drive index"""
+    st.header("📈 Time Series")
+
+    snapshots = st.session_state.df
+    drive_index = st.session_state.drive_index
+    drive_keys = list(zip(drives_df['hostname'], drives_df['serial_number']))
+
+    selected = st.multiselect("Drives", drive_keys, default=drive_keys[:5],
+                              format_func=lambda key: f"{key[0]} - {key[1]}")
+    if not selected:
+        st.info("Select one or more drives to plot.")
+        return
+
+    show_deltas = st.checkbox("Show change between snapshots",
+                              help="Plot the difference from each drive's previous snapshot")
+
+    positions = np.concatenate([drive_index[key] for key in selected])
+    series_df = snapshots.take(positions)
+    series_df = series_df.assign(drive=series_df['hostname'].astype(str) + " - " + series_df['serial_number'].astype(str))
+
+    for title, column in TIME_SERIES_METRICS.items():
+        if show_deltas:
+            column = f"{column}_delta"
+            title = f"Change in {title}"
+        fig = px.line(series_df, x='timestamp', y=column, color='drive', markers=True, title=title)
+        st.plotly_chart(fig, use_container_width=True)
+
 def main():
     st.title("💾 NVMe SMART Dashboard")
     st.markdown("---")
@@ -127,48 +293,61 @@ def main():
         st.header("Settings")
         log_dir = st.text_input("Log Directory", value="/opt/nvme_smart_logs")
         refresh = st.button("🔄 Refresh Data")
+        top_n = st.slider("Drives per Chart", min_value=10, max_value=200, value=50, step=10,
+                          help="Larger fleets show a histogram plus bars for only the highest drives")
 
         st.markdown("---")
         st.header("Filters")
+        view = st.radio("View", ["Latest per Drive", "Time Series"],
+                        help="Latest snapshot of each drive, or every snapshot over time")
         show_advanced = st.checkbox("Advanced Mode", help="Show detailed SMART statistics")
 
         # Add filters (only show if data is loaded)
+        selected_model = selected_capacity = selected_host = 'All'
         if 'df' in st.session_state and not st.session_state.df.empty:
-            df_for_filters = st.session_state.df
+            filter_index = st.session_state.filter_index
 
             # Model filter
-            models = ['All'] + sorted(df_for_filters['model_number'].unique().tolist())
+            models = ['All'] + sorted(filter_index['model_number'])
             selected_model = st.selectbox("Filter by Model", models)
 
             # Capacity filter
-            capacities = ['All'] + sorted([f"{cap:.1f} TB" for cap in df_for_filters['capacity_tb'].unique() if cap > 0])
+            capacities = ['All'] + sorted(filter_index['capacity'], key=lambda label: float(label.split(' ')[0]))
             selected_capacity = st.selectbox("Filter by Capacity", capacities)
 
             # Host filter
-            hosts = ['All'] + sorted(df_for_filters['hostname'].unique().tolist())
+            hosts = ['All'] + sorted(filter_index['hostname'])
             selected_host = st.selectbox("Filter by Host", hosts)
 
     # Load data
     if 'df' not in st.session_state or refresh:
         with st.spinner("Loading SMART data..."):
-            st.session_state.df = load_smart_data(log_dir)
+            df = load_smart_data(log_dir)
+            if not df.empty:
+                df, st.session_state.latest_df, st.session_state.drive_index = build_views(df)
+                st.session_state.filter_index = build_filter_index(st.session_state.latest_df)
+            st.session_state.df = df
+            # Keys the cached filter and chart results to this load
+            st.session_state.data_version = uuid.uuid4().hex
 
     df = st.session_state.df
+    view_key = (st.session_state.data_version, selected_model, selected_capacity, selected_host)
 
     # Apply filters if they exist
-    if 'df' in st.session_state and not st.session_state.df.empty:
-        if 'selected_model' in locals() and selected_model != 'All':
-            df = df[df['model_number'] == selected_model]
-        if 'selected_capacity' in locals() and selected_capacity != 'All':
-            capacity_val = float(selected_capacity.split(' ')[0])
-            df = df[abs(df['capacity_tb'] - capacity_val) < 0.1]
-        if 'selected_host' in locals() and selected_host != 'All':
-            df = df[df['hostname'] == selected_host]
+    if not df.empty:
+        positions = filter_positions(st.session_state.filter_index, *view_key)
+        df = st.session_state.latest_df
+        if positions is not None:
+            df = df.take(positions)
 
     if df.empty:
         st.error("No data available. Check the log directory path or adjust filters.")
         return
 
+    if view == "Time Series":
+        show_time_series(df)
+        return
+
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
 
@@ -215,11 +394,7 @@ def main():
 
     with col1:
         st.subheader("Power On Hours")
-        fig_hours = px.bar(df, x='serial_number', y='power_on_hours',
-                          hover_data=['hostname', 'device', 'model_number'],
-                          title="Power On Hours by Drive")
-        fig_hours.update_xaxes(tickangle=45)
-        st.plotly_chart(fig_hours, use_container_width=True)
+        show_drive_metric(df, view_key, 'power_on_hours', "Power On Hours", top_n)
 
         # Add human readable durations
         if st.checkbox("Show Readable Duration"):
@@ -230,37 +405,21 @@ def main():
 
     with col2:
         st.subheader("Percent Used")
-        fig_used = px.bar(df, x='serial_number', y='percent_used',
-                         color='percent_used', color_continuous_scale='RdYlGn_r',
-                         hover_data=['hostname', 'device', 'model_number'],
-                         title="Wear Level (% Used) by Drive")
-        fig_used.update_xaxes(tickangle=45)
-        fig_used.add_hline(y=80, line_dash="dash", line_color="orange",
-                          annotation_text="80% Warning Level")
-        st.plotly_chart(fig_used, use_container_width=True)
+        show_drive_metric(df, view_key, 'percent_used', "Wear Level (% Used)", top_n,
+                          thresholds=[(80, "orange", "80% Warning Level")],
+                          color='percent_used', color_continuous_scale='RdYlGn_r')
 
     col3, col4 = st.columns(2)
 
     with col3:
         st.subheader("Total Bytes Written (TBW)")
-        fig_tbw = px.bar(df, x='serial_number', y='data_units_written',
-                        hover_data=['hostname', 'device', 'model_number'],
-                        title="Total Terabytes Written by Drive")
-        fig_tbw.update_xaxes(tickangle=45)
-        st.plotly_chart(fig_tbw, use_container_width=True)
+        show_drive_metric(df, view_key, 'data_units_written', "Total Terabytes Written", top_n)
 
     with col4:
         st.subheader("Temperature")
-        fig_temp = px.bar(df, x='serial_number', y='temperature',
-                         color='temperature', color_continuous_scale='thermal',
-                         hover_data=['hostname', 'device', 'model_number'],
-                         title="Current Temperature by Drive")
-        fig_temp.update_xaxes(tickangle=45)
-        fig_temp.add_hline(y=70, line_dash="dash", line_color="orange",
-                          annotation_text="70°C Warning")
-        fig_temp.add_hline(y=85, line_dash="dash", line_color="red",
-                          annotation_text="85°C Critical")
-        st.plotly_chart(fig_temp, use_container_width=True)
+        show_drive_metric(df, view_key, 'temperature', "Current Temperature", top_n,
+                          thresholds=[(70, "orange", "70°C Warning"), (85, "red", "85°C Critical")],
+                          color='temperature', color_continuous_scale='thermal')
 
     # Data Table
     st.markdown("---")
@@ -311,13 +470,13 @@ def main():
             st.write(f"**Host Writes:** {drive_data['host_writes']:.2f} TB")
             st.write(f"**Host Reads:** {drive_data['host_reads']:.2f} TB")
 
-        # Full SMART data
+        # Full SMART data, read from the drive's log file on demand
+        smart_data = load_full_smart_data(drive_data['file_path'], drive_data['line'])
         st.subheader("Complete SMART Data")
         with st.expander("View Raw SMART JSON"):
-            st.json(drive_data['full_smart_data'])
+            st.json(smart_data)
 
         # SMART fields analysis
-        smart_data = drive_data['full_smart_data']
         smart_fields = []
 
         for key, value in smart_data.items():
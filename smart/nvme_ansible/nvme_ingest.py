@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+NVMe SMART log ingest
+Parses the per-device JSON files and the per-host NDJSON batches (*.ndjson.gz,
+written by nvme_collector.py) from nvme_smart_logs.yml into dashboard records.
+Kept free of Streamlit so parsing can run in worker processes.
+"""
+
+import gzip
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Below this many files a process pool costs more to start than it saves
+PARALLEL_MIN_FILES = 500
+FILES_PER_CHUNK = 256
+BATCH_SUFFIX = '.ndjson.gz'
+
+# Column name -> dtype of the in-memory frame, in record tuple order.
+# Strings with few distinct values are categoricals; file_path and line are the
+# lazy reference used to re-read the full SMART log on demand (line is the record's
+# line in an NDJSON batch, 0 for a JSON file).
+RECORD_DTYPES = {
+    'hostname': 'category',
+    'device': 'category',
+    'serial_number': 'category',
+    'timestamp': 'datetime64[ns, UTC]',
+    'file_path': 'object',
+    'line': 'int64',
+
+    'model_number': 'category',
+    'capacity_tb': 'float32',
+    'firmware_rev': 'category',
+
+    'critical_warning': 'int64',
+    'avail_spare': 'int64',
+    'spare_thresh': 'int64',
+    'percent_used': 'int64',
+    'power_on_hours': 'int64',
+    'unsafe_shutdowns': 'int64',
+    'media_errors': 'int64',
+    'num_err_log_entries': 'int64',
+
+    'temperature': 'float32',
+    'temp_sensor_1': 'float32',
+    'temp_sensor_2': 'float32',
+
+    # TB totals stay float64 so fleet-wide sums keep their precision
+    'data_units_written': 'float64',
+    'data_units_read': 'float64',
+    'host_writes': 'float64',
+    'host_reads': 'float64',
+}
+RECORD_COLUMNS = list(RECORD_DTYPES)
+
+def loads(raw):
+    """Decode JSON bytes with orjson when installed, falling back to the stdlib"""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects integers wider than 64 bits; the stdlib does not
+            pass
+    return json.loads(raw)
+
+def celsius(value):
+    """Convert a temperature from Kelvin to Celsius if it looks like Kelvin"""
+    return value - 273.15 if value > 200 else value
+
+def data_units_tb(value):
+    """Convert NVMe data units to decimal TB"""
+    # NVMe spec: data_units_written is in thousands, so multiply by 1000, then * 512 bytes, then convert to decimal TB
+    return (value * 1000 * 512) / (1000**4)
+
+def parse_record(log_data, file_path, line=0):
+    """Turn one device's log data into a record tuple, or None if it has no SMART log"""
+    if 'smart_log' not in log_data or not log_data['smart_log']:
+        return None
+
+    smart = log_data['smart_log'].get
+    id_ctrl_data = log_data.get('id_ctrl') or {}
+
+    # Use TNVMCAP (Total NVM Capacity) field from id_ctrl which gives capacity directly in bytes
+    capacity_bytes = id_ctrl_data.get('tnvmcap', 0)
+
+    # Must stay in RECORD_COLUMNS order
+    return (
+        log_data.get('hostname', 'Unknown'),
+        log_data.get('device', 'Unknown'),
+        log_data.get('serial_number', 'Unknown'),
+        log_data.get('timestamp', ''),
+        file_path,
+        line,
+
+        id_ctrl_data.get('mn', 'Unknown').strip(),
+        capacity_bytes / (1000**4) if capacity_bytes > 0 else 0,
+        id_ctrl_data.get('fr', 'Unknown').strip(),
+
+        smart('critical_warning', 0),
+        smart('avail_spare', 0),
+        smart('spare_thresh', 0),
+        smart('percent_used', 0),
+        smart('power_on_hours', 0),
+        smart('unsafe_shutdowns', 0),
+        smart('media_errors', 0),
+        smart('num_err_log_entries', 0),
+
+        celsius(smart('temperature', 0)),
+        celsius(smart('temp_sensor_1', 0)),
+        celsius(smart('temp_sensor_2', 0)),
+
+        data_units_tb(smart('data_units_written', 0)),
+        data_units_tb(smart('data_units_read', 0)),
+        data_units_tb(smart('host_writes', 0)),
+        data_units_tb(smart('host_reads', 0)),
+    )
+
+def parse_smart_file(file_path):
+    """Parse a SMART log JSON file or NDJSON batch into a list of record tuples"""
+    if file_path.endswith(BATCH_SUFFIX):
+        records = []
+        with gzip.open(file_path, 'rb') as f:
+            for line, raw in enumerate(f):
+                if raw.strip():
+                    records.append(parse_record(loads(raw), file_path, line))
+        return [record for record in records if record is not None]
+
+    with open(file_path, 'rb') as f:
+        record = parse_record(loads(f.read()), file_path)
+    return [] if record is None else [record]
+
+def load_full_smart_data(file_path, line=0):
+    """Re-read the complete SMART log for one record, used by advanced mode"""
+    if file_path.endswith(BATCH_SUFFIX):
+        with gzip.open(file_path, 'rb') as f:
+            for index, raw in enumerate(f):
+                if index == line:
+                    return loads(raw).get('smart_log', {})
+        return {}
+    with open(file_path, 'rb') as f:
+        return loads(f.read()).get('smart_log', {})
+
+def parse_smart_files(file_paths):
+    """Parse a batch of files, returning (file_path, list of record tuples, error or None) tuples"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append((file_path, parse_smart_file(file_path), None))
+        except Exception as e:
+            results.append((file_path, [], str(e)))
+    return results
+
+def iter_parsed_files(file_paths, max_workers=None):
+    """Parse files in chunked batches across a process pool, yielding results in input order"""
+    file_paths = list(file_paths)
+    if len(file_paths) < PARALLEL_MIN_FILES:
+        yield from parse_smart_files(file_paths)
+        return
+
+    chunks = [file_paths[i:i + FILES_PER_CHUNK] for i in range(0, len(file_paths), FILES_PER_CHUNK)]
+    max_workers = max_workers or os.cpu_count() or 1
+    # spawn rather than fork: the dashboard process runs Streamlit's server threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        for results in executor.map(parse_smart_files, chunks):
+            yield from results
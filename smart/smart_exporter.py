@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+SMART Prometheus exporter
+Serves NVMe SMART fields and selected SATA/ATA attributes on /metrics, using the same
+parsing as nvme_ingest.py (dashboard) and smart_sata_csv.py. A background thread reads
+every device each --interval seconds; scrapes only render the latest reads, so a slow
+or hung drive never holds up /metrics and scrapes never trigger smartctl/nvme calls.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nvme_ansible"))
+
+import smart_sata_csv
+import nvme_collector
+import nvme_ingest
+
+METRICS_PORT = 9915
+REFRESH_SECONDS = 60  # time between two sweeps queueing device reads
+MAX_WORKERS = 16
+
+# read_nvme record key -> (metric name, type, help). Lifetime totals that only ever go up are counters.
+NVME_METRICS = {
+    'critical_warning': ("nvme_critical_warning", "gauge", "Critical warning bit field from the SMART log."),
+    'percent_used': ("nvme_percent_used", "gauge", "Vendor estimate of drive life used, in percent."),
+    'avail_spare': ("nvme_avail_spare", "gauge", "Available spare capacity, in percent."),
+    'spare_thresh': ("nvme_spare_thresh", "gauge", "Available spare threshold, in percent."),
+    'temperature': ("nvme_temperature_celsius", "gauge", "Composite temperature."),
+    'temp_sensor_1': ("nvme_temp_sensor_1_celsius", "gauge", "Temperature sensor 1."),
+    'temp_sensor_2': ("nvme_temp_sensor_2_celsius", "gauge", "Temperature sensor 2."),
+    'data_written_bytes': ("nvme_data_written_bytes_total", "counter", "Bytes written by the host (SMART data units written)."),
+    'data_read_bytes': ("nvme_data_read_bytes_total", "counter", "Bytes read by the host (SMART data units read)."),
+    'media_errors': ("nvme_media_errors_total", "counter", "Unrecovered data integrity errors."),
+    'unsafe_shutdowns': ("nvme_unsafe_shutdowns_total", "counter", "Unsafe shutdown count."),
+    'power_on_hours': ("nvme_power_on_hours_total", "counter", "Power-on hours."),
+}
+# NVMe data units are 1000 512-byte blocks
+DATA_UNIT_BYTES = 1000 * 512
+# Reallocated sectors, reported uncorrectable, current pending sectors, total LBAs written
+ATA_ATTRIBUTE_IDS = {5, 187, 197, 241}
+
+class DeviceCache:
+    """Latest read of each device, updated as each background read finishes"""
+
+    def __init__(self, read):
+        self.read = read
+        self.entries = {}  # device -> (unix time of the read, value)
+        self.pending = {}  # device -> future of its queued or running read
+        self.lock = threading.Lock()
+
+    def refresh(self, devices, executor):
+        """Start reading devices, forgetting ones that went away
+
+        A device whose previous read has not finished (e.g. smartctl stuck in the kernel)
+        is skipped rather than queued again, and nothing waits for it.
+        """
+        with self.lock:
+            self.entries = {device: entry for device, entry in self.entries.items() if device in devices}
+        self.pending = {device: future for device, future in self.pending.items()
+                        if device in devices and not future.done()}
+        for device in devices:
+            if device in self.pending:
+                if self.pending[device].running():
+                    print(f"Still reading {device}, skipping it this sweep")
+                continue
+            self.pending[device] = executor.submit(self.update, device)
+
+    def update(self, device):
+        value = self.read(device)
+        with self.lock:
+            self.entries[device] = (time.time(), value)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(sorted(self.entries.items()))
+
+# id-ctrl (serial, model, capacity) does not change, so it is read once per device
+id_ctrl_cache = {}
+
+def read_nvme(device):
+    """Return the nvme_ingest record for one namespace as a dict, plus exact byte totals, or None"""
+    smart_log = nvme_collector.run_nvme_command(["smart-log", device])
+    if not smart_log:
+        return None
+    if device not in id_ctrl_cache:
+        id_ctrl = nvme_collector.run_nvme_command(["id-ctrl", device])
+        if id_ctrl is None:
+            return None
+        id_ctrl_cache[device] = id_ctrl
+    log_data = {
+        "device": device,
+        "serial_number": str(id_ctrl_cache[device].get("sn", "UNKNOWN")).strip(),
+        "smart_log": smart_log,
+        "id_ctrl": id_ctrl_cache[device],
+    }
+    record = nvme_ingest.parse_record(log_data, device)
+    if record is None:
+        return None
+    record = dict(zip(nvme_ingest.RECORD_COLUMNS, record))
+    # The record has decimal TB; counters are exported in bytes straight from the data units
+    record['data_written_bytes'] = smart_log.get('data_units_written', 0) * DATA_UNIT_BYTES
+    record['data_read_bytes'] = smart_log.get('data_units_read', 0) * DATA_UNIT_BYTES
+    return record
+
+def read_sata(device):
+    """Return smart_sata_csv rows for one drive, limited to ATA_ATTRIBUTE_IDS, or None if the read failed
+
+    A drive without ATA attributes (SAS, many SSDs) reads fine and returns [].
+    """
+    try:
+        rows = smart_sata_csv.parse_json(smart_sata_csv.get_smart_data(device))
+    except subprocess.TimeoutExpired:
+        print(f"Timed out reading {device} after {smart_sata_csv.SMARTCTL_TIMEOUT}s")
+        return None
+    except Exception as e:
+        print(f"Error reading {device}: {e!r}")
+        return None
+    return [row for row in rows if row[3] in ATA_ATTRIBUTE_IDS]
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def labels(**values):
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in values.items()) + "}"
+
+class Collector:
+    """Reads every device in a background thread and renders the latest reads in the Prometheus text format"""
+
+    def __init__(self, interval=REFRESH_SECONDS):
+        self.interval = interval
+        self.nvme = DeviceCache(read_nvme)
+        self.sata = DeviceCache(read_sata)
+
+    def refresh(self, executor):
+        """Queue a read of every device; each result is published as soon as it arrives"""
+        self.nvme.refresh(nvme_collector.list_namespaces(), executor)
+        self.sata.refresh(smart_sata_csv.list_devices(), executor)
+
+    def run(self, stop):
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        try:
+            while True:
+                try:
+                    self.refresh(executor)
+                except Exception as e:
+                    print(f"Error refreshing devices: {e!r}")
+                if stop.wait(self.interval):
+                    return
+        finally:
+            # Don't wait on reads that may never return
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        stop = threading.Event()
+        threading.Thread(target=self.run, args=(stop,), daemon=True).start()
+        return stop
+
+    def render(self):
+        nvme_entries, sata_entries = self.nvme.snapshot(), self.sata.snapshot()
+        nvme = {device: record for device, (_, record) in nvme_entries.items()}
+        sata = {device: rows for device, (_, rows) in sata_entries.items()}
+
+        lines = []
+        for column, (name, kind, help_text) in NVME_METRICS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{labels(device=device, serial=record['serial_number'], model=record['model_number'])} "
+                      f"{record[column]}"
+                      for device, record in nvme.items() if record is not None]
+
+        lines += [
+            "# HELP smart_ata_attribute_raw_value Raw value of selected ATA SMART attributes.",
+            "# TYPE smart_ata_attribute_raw_value gauge",
+        ]
+        for device, rows in sata.items():
+            for model, serial, _, attribute_id, attribute_name, _, _, _, _, raw_value in rows or []:
+                lines.append(f"smart_ata_attribute_raw_value"
+                             f"{labels(device=device, serial=serial, model=model, id=attribute_id, name=attribute_name)} "
+                             f"{raw_value}")
+
+        lines += [
+            "# HELP smart_device_up Whether the last read of the device succeeded.",
+            "# TYPE smart_device_up gauge",
+        ]
+        lines += [f"smart_device_up{labels(device=device, type='nvme')} {int(record is not None)}"
+                  for device, record in nvme.items()]
+        lines += [f"smart_device_up{labels(device=device, type='sata')} {int(rows is not None)}"
+                  for device, rows in sata.items()]
+        lines += [
+            "# HELP smart_device_last_read_timestamp_seconds Unix time the device was last read.",
+            "# TYPE smart_device_last_read_timestamp_seconds gauge",
+        ]
+        lines += [f"smart_device_last_read_timestamp_seconds{labels(device=device, type=kind)} {read_time:.0f}"
+                  for kind, entries in (("nvme", nvme_entries), ("sata", sata_entries))
+                  for device, (read_time, _) in entries.items()]
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves Collector.render() in the Prometheus text format on /metrics."""
+
+    collector = None
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.collector.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Prometheus exporter for NVMe SMART logs and SATA SMART attributes")
+    parser.add_argument("--port", type=int, default=METRICS_PORT, help="Port for /metrics (default %(default)s)")
+    parser.add_argument("--interval", type=float, default=REFRESH_SECONDS,
+                        help="Seconds between background reads of every device (default %(default)s)")
+    args = parser.parse_args()
+
+    MetricsHandler.collector = Collector(args.interval)
+    MetricsHandler.collector.start()
+    server = ThreadingHTTPServer(("", args.port), MetricsHandler)
+    print(f"Serving SMART metrics on :{args.port}/metrics")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
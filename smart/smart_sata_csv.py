@@ -1,10 +1,36 @@
+import argparse
 import subprocess
 import json
 import csv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
-def get_smart_data(device):
-    result = subprocess.run(['smartctl', '-a', device, '-j'], stdout=subprocess.PIPE)
+# smartctl calls run concurrently; a spun-down or hung drive only holds up its own worker
+MAX_WORKERS = 16
+SMARTCTL_TIMEOUT = 60  # seconds per device
+CSV_FILE = 'smart_attributes.csv'
+PARQUET_DIR = 'smart_attributes.parquet'
+CSV_HEADER = ['Model Name', 'Serial Number', 'Firmware Version', 'ID', 'Name', 'Value', 'Worst', 'Thresh', 'When Failed', 'Raw Value']
+WIDE_HEADER = CSV_HEADER[:3]
+
+# Parquet column names and types for the long layout, in parse_json row order
+PARQUET_COLUMNS = {
+    'model_name': 'category',
+    'serial_number': 'category',
+    'firmware_version': 'category',
+    'id': 'uint8',
+    'name': 'category',
+    'value': 'int16',
+    'worst': 'int16',
+    'thresh': 'int16',
+    'when_failed': 'category',
+    'raw_value': 'int64',
+}
+
+def get_smart_data(device, timeout=SMARTCTL_TIMEOUT):
+    result = subprocess.run(['smartctl', '-a', device, '-j'], stdout=subprocess.PIPE, timeout=timeout)
     return json.loads(result.stdout)
 
 def parse_json(data):
@@ -32,22 +58,258 @@ def parse_json(data):
         ])
     return rows
 
-def write_csv(data, file):
-    with open(file, 'a', newline='') as f:
+def collect_device(device):
+    """Read and parse one device, returning no rows if smartctl fails, times out or its output can't be parsed"""
+    try:
+        return parse_json(get_smart_data(device, timeout=SMARTCTL_TIMEOUT))
+    except subprocess.TimeoutExpired:
+        print(f"Timed out reading {device} after {SMARTCTL_TIMEOUT}s")
+    except Exception as e:
+        # Unusual smartctl output (missing keys, wrong types) must not stop the rest of the sweep
+        print(f"Error reading {device}: {e!r}")
+    return []
+
+def list_devices():
+    # Get a list of all SCSI devices (which includes SATA devices)
+    return [f'/dev/{device}' for device in os.listdir('/dev') if device.startswith('sd') and not device[2:].isdigit()]
+
+def sweep(devices):
+    """Collect every device concurrently, yielding each device's rows in device order"""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        yield from executor.map(collect_device, devices)
+
+def widen(rows):
+    """Pivot long rows into one row per drive with a raw-value column per attribute ID"""
+    drives = {}
+    for row in rows:
+        drive = drives.setdefault(tuple(row[:3]), {})
+        drive.setdefault(row[3], row[9])
+    ids = sorted({attr_id for attrs in drives.values() for attr_id in attrs})
+    wide_rows = [list(drive) + [attrs.get(attr_id) for attr_id in ids] for drive, attrs in drives.items()]
+    return ids, wide_rows
+
+def write_csv(device_rows, file, wide=False):
+    # One writer for the whole sweep; rows are written in device order as results arrive
+    with open(file, 'w', newline='') as f:
         writer = csv.writer(f, delimiter=';')
-        writer.writerows(data)
-
-# Get a list of all SCSI devices (which includes SATA devices)
-devices = [device for device in os.listdir('/dev') if device.startswith('sd') and not device[2:].isdigit()]
-
-# Initialize CSV file with headers
-with open('smart_attributes.csv', 'w', newline='') as f:
-    writer = csv.writer(f, delimiter=';')
-    writer.writerow(['Model Name', 'Serial Number', 'Firmware Version', 'ID', 'Name', 'Value', 'Worst', 'Thresh', 'When Failed', 'Raw Value'])
-
-# Iterate over devices and write SMART data to CSV
-for device in devices:
-    data = get_smart_data(f'/dev/{device}')
-    parsed_data = parse_json(data)
-    if parsed_data:  # Only write data if there's something to write
-        write_csv(parsed_data, 'smart_attributes.csv')
\ No newline at end of file
+        if wide:
+            ids, wide_rows = widen(row for rows in device_rows for row in rows)
+            writer.writerow(WIDE_HEADER + ids)
+            writer.writerows(wide_rows)
+            return
+
+        writer.writerow(CSV_HEADER)
+        for rows in device_rows:
+            if rows:  # Only write data if there's something to write
+                writer.writerows(rows)
+
+def wide_ids(directory):
+    """Attribute IDs of the raw_<id> columns in each Parquet file of a dataset directory"""
+    import pyarrow.parquet as pq
+    return {name: {int(column[4:]) for column in pq.read_schema(os.path.join(directory, name)).names
+                   if column.startswith('raw_')}
+            for name in os.listdir(directory) if name.endswith('.parquet')}
+
+def add_wide_columns(df, ids):
+    """Give a wide frame one nullable raw_<id> column per id, in id order"""
+    import pandas as pd
+    for attr_id in ids:
+        if f'raw_{attr_id}' not in df:
+            df[f'raw_{attr_id}'] = pd.Series(pd.NA, index=df.index, dtype='Int64')
+    leading = [column for column in df.columns if not column.startswith('raw_')]
+    return df[leading + [f'raw_{attr_id}' for attr_id in sorted(ids)]]
+
+def write_parquet(device_rows, directory, wide=False, append=False, timestamp=None):
+    """Write one sweep as a typed Parquet file in a dataset directory, one file per sweep
+
+    Wide datasets keep one schema across files: every file has a raw_<id> column for every
+    attribute ID seen in any sweep (null where a drive lacks it), so pd.read_parquet(directory)
+    returns all of them. A sweep with new IDs adds them to the earlier files.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise SystemExit("Parquet output needs pandas and pyarrow: pip install pandas pyarrow")
+
+    timestamp = timestamp or datetime.now(timezone.utc)
+    rows = [row for rows in device_rows for row in rows]
+    if wide:
+        ids, wide_rows = widen(rows)
+        df = pd.DataFrame(wide_rows, columns=list(PARQUET_COLUMNS)[:3] + [f'raw_{attr_id}' for attr_id in ids])
+        df = df.astype({column: 'category' for column in list(PARQUET_COLUMNS)[:3]})
+        df = df.astype({f'raw_{attr_id}': 'Int64' for attr_id in ids})
+    else:
+        df = pd.DataFrame(rows, columns=list(PARQUET_COLUMNS)).astype(PARQUET_COLUMNS)
+    # Categoricals are written as dictionary-encoded string columns
+    df.insert(0, 'timestamp', pd.Timestamp(timestamp))
+
+    os.makedirs(directory, exist_ok=True)
+    if not append:
+        for name in os.listdir(directory):
+            if name.endswith('.parquet'):
+                os.remove(os.path.join(directory, name))
+    if wide:
+        file_ids = wide_ids(directory)
+        all_ids = set(ids).union(*file_ids.values())
+        for name, existing in file_ids.items():
+            if existing != all_ids:
+                # Dot-prefixed so a leftover temp file is never read as part of the dataset
+                path, tmp = os.path.join(directory, name), os.path.join(directory, f".{name}.tmp")
+                add_wide_columns(pd.read_parquet(path), all_ids).to_parquet(tmp, index=False)
+                os.replace(tmp, path)
+        df = add_wide_columns(df, all_ids)
+    df.to_parquet(os.path.join(directory, f"sweep-{timestamp:%Y%m%dT%H%M%SZ}.parquet"), index=False)
+
+def attribute_state(rows):
+    """Group parse_json rows by serial: serial -> [model, firmware, {id: [name, value, worst, thresh, when_failed, raw]}]"""
+    state = {}
+    for row in rows:
+        drive = state.setdefault(row[1], [row[0], row[2], {}])
+        # IDs are strings so the state survives a JSON round trip unchanged
+        drive[2].setdefault(str(row[3]), [row[4]] + list(row[5:]))
+    return state
+
+def diff_state(previous, current, timestamp):
+    """Diff log records for drives that are new or changed since the previous snapshot"""
+    records = []
+    for serial, (model_name, firmware_version, attributes) in current.items():
+        record = {'timestamp': timestamp, 'serial_number': serial}
+        if serial not in previous:
+            record.update(full=True, model_name=model_name, firmware_version=firmware_version,
+                          attributes=attributes)
+            records.append(record)
+            continue
+
+        prev_model, prev_firmware, prev_attributes = previous[serial]
+        changed = {attr_id: attr for attr_id, attr in attributes.items() if prev_attributes.get(attr_id) != attr}
+        if model_name != prev_model:
+            record['model_name'] = model_name
+        if firmware_version != prev_firmware:
+            record['firmware_version'] = firmware_version
+        if changed:
+            record['attributes'] = changed
+        if len(record) > 2:
+            records.append(record)
+    return records
+
+def apply_diff(state, record):
+    """Apply one diff log record to a state in place"""
+    serial = record['serial_number']
+    if record.get('full') or serial not in state:
+        state[serial] = [record.get('model_name', ''), record.get('firmware_version', ''), {}]
+    drive = state[serial]
+    drive[0] = record.get('model_name', drive[0])
+    drive[1] = record.get('firmware_version', drive[1])
+    drive[2].update(record.get('attributes', {}))
+
+def state_rows(state):
+    """Flatten a state back into parse_json rows"""
+    return [[model_name, serial, firmware_version, int(attr_id)] + attr
+            for serial, (model_name, firmware_version, attributes) in state.items()
+            for attr_id, attr in sorted(attributes.items(), key=lambda item: int(item[0]))]
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp (datetime or string) into an aware datetime; naive times are UTC"""
+    timestamp = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+def read_rows_at(log_file, timestamp=None):
+    """Reconstruct every drive's full attribute table from a diff log as of timestamp (latest if None)
+
+    timestamp is a datetime or any ISO 8601 string (2024-05-01 12:00, 2024-05-01T12:00:00+02:00, ...).
+    """
+    if timestamp is not None:
+        timestamp = parse_timestamp(timestamp)
+    state = {}
+    with open(log_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if timestamp is not None and parse_timestamp(record['timestamp']) > timestamp:
+                break
+            apply_diff(state, record)
+    return state_rows(state)
+
+def write_diff(device_rows, log_file):
+    """Append only what changed since the previous sweep to an NDJSON diff log"""
+    state_file = f"{log_file}.state.json"
+    previous = {}
+    # Without the log there is nothing to diff against, whatever the state file says
+    if os.path.exists(log_file):
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                previous = json.load(f)
+        else:
+            previous = attribute_state(read_rows_at(log_file))
+
+    timestamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    current = attribute_state(row for rows in device_rows for row in rows)
+    records = diff_state(previous, current, timestamp)
+    with open(log_file, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+    # Drives missing from this sweep keep their last known state
+    previous.update(current)
+    with open(f"{state_file}.tmp", 'w') as f:
+        json.dump(previous, f)
+    os.replace(f"{state_file}.tmp", state_file)
+    return len(records)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collect SATA SMART attributes from every /dev/sd* device")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="csv (default) or a typed Parquet dataset directory with one file per sweep")
+    parser.add_argument('--output', help=f"Output path (default {CSV_FILE} or {PARQUET_DIR})")
+    parser.add_argument('--wide', action='store_true',
+                        help="One row per drive with one raw-value column per attribute ID")
+    parser.add_argument('--append', action='store_true',
+                        help="Parquet only: keep earlier sweeps in the dataset instead of replacing them")
+    parser.add_argument('--diff', metavar='LOG',
+                        help="Append only attributes that changed since the previous sweep to an NDJSON diff log")
+    parser.add_argument('--interval', type=float,
+                        help="With --diff: keep sampling every INTERVAL seconds")
+    parser.add_argument('--at', metavar='TIMESTAMP',
+                        help="With --diff: write the full table as of an ISO 8601 timestamp (UTC unless it has an "
+                             "offset, or 'latest') reconstructed from the log, instead of sampling")
+    args = parser.parse_args()
+    if args.append and args.format != 'parquet':
+        parser.error("--append requires --format parquet")
+    if (args.interval or args.at) and not args.diff:
+        parser.error("--interval and --at require --diff")
+    if args.diff and args.format == 'parquet':
+        parser.error("--diff writes an NDJSON log (and --at a CSV); it does not support --format parquet")
+    if args.at and args.at != 'latest':
+        try:
+            args.at = parse_timestamp(args.at)
+        except ValueError:
+            parser.error(f"--at: {args.at!r} is not an ISO 8601 timestamp")
+    return args
+
+def main():
+    args = parse_args()
+
+    if args.diff and args.at:
+        rows = read_rows_at(args.diff, None if args.at == 'latest' else args.at)
+        write_csv([rows], args.output or CSV_FILE, wide=args.wide)
+        return
+
+    if args.diff:
+        devices = list_devices()
+        next_sweep = time.monotonic()
+        while True:
+            changed = write_diff(sweep(devices), args.diff)
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} - {changed} drives changed")
+            if not args.interval:
+                return
+            next_sweep += args.interval
+            time.sleep(max(0, next_sweep - time.monotonic()))
+
+    device_rows = sweep(list_devices())
+
+    if args.format == 'parquet':
+        write_parquet(device_rows, args.output or PARQUET_DIR, wide=args.wide, append=args.append)
+    else:
+        write_csv(device_rows, args.output or CSV_FILE, wide=args.wide)
+
+if __name__ == "__main__":
+    main()
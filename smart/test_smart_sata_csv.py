@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import smart_sata_csv
+
+pytest.importorskip("pyarrow")
+
+def drive(serial, attributes):
+    """parse_json rows for one drive with {id: raw value} attributes"""
+    return [["HDD", serial, "FW1", attr_id, f"A{attr_id}", 100, 100, 0, "", raw]
+            for attr_id, raw in attributes.items()]
+
+def test_wide_append_keeps_every_attribute_column(tmp_path):
+    directory = tmp_path / "smart.parquet"
+    smart_sata_csv.write_parquet([drive("S1", {5: 1, 187: 2})], directory, wide=True, append=True,
+                                 timestamp=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    smart_sata_csv.write_parquet([drive("S1", {5: 3, 187: 4}), drive("S2", {5: 0, 197: 7})], directory,
+                                 wide=True, append=True, timestamp=datetime(2024, 1, 2, tzinfo=timezone.utc))
+
+    df = pd.read_parquet(directory).sort_values(["timestamp", "serial_number"]).reset_index(drop=True)
+    assert [column for column in df.columns if column.startswith("raw_")] == ["raw_5", "raw_187", "raw_197"]
+    assert len(df) == 3
+    assert df["raw_197"].isna().tolist() == [True, True, False]
+    assert df.loc[2, "raw_197"] == 7
+    assert df.loc[1, "raw_5"] == 3
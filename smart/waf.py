@@ -1,64 +1,336 @@
+import argparse
+import ctypes
+import fcntl
 import subprocess
 import json
+import os
+import queue
+import re
+import struct
+import threading
 import time
 import csv
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Defaults: sample every controller every 10 seconds
+INTERVAL = 10
+CSV_FILE = "nvme_log.csv"
+COMMAND_TIMEOUT = 30  # seconds per nvme-cli call
+WINDOWS = ["1m", "10m", "1h"]  # rolling WAF windows
+METRICS_PORT = 9916
+
+# nvme-cli needs root; use non-interactive sudo when not already running as root
+SUDO = [] if os.geteuid() == 0 else ["sudo", "-n"]
 
 # Function to execute nvme command and return JSON output
-def run_nvme_command(command):
+def run_nvme_command(args):
+    command = SUDO + ["nvme"] + args + ["-o", "json"]
     try:
-        result = subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                timeout=COMMAND_TIMEOUT)
         return json.loads(result.stdout)
     except subprocess.CalledProcessError as e:
-        print(f"Error running command: {command}")
+        print(f"Error running command: {' '.join(command)}")
         print(e.stderr.decode())
-        return None
+    except subprocess.TimeoutExpired:
+        print(f"Timed out running command: {' '.join(command)}")
+    except (OSError, ValueError) as e:
+        print(f"Error running command: {' '.join(command)}: {e}")
+    return None
+
+def counter_value(field):
+    """Full value of an nvme-cli counter, which is either an int or a 128-bit {"hi", "lo"} pair"""
+    if isinstance(field, dict):
+        return (field.get("hi", 0) << 64) | field.get("lo", 0)
+    return int(field)
 
 # Function to calculate NAND writes and host writes
 def calculate_writes(nvme_smart_log, nvme_ocp_log):
     if nvme_smart_log and nvme_ocp_log:
-        nand_writes = nvme_ocp_log["Physical media units written"]["lo"]
-        host_writes = nvme_smart_log["data_units_written"] * 512 * 1000  # bytes
+        nand_writes = counter_value(nvme_ocp_log["Physical media units written"])
+        host_writes = counter_value(nvme_smart_log["data_units_written"]) * 512 * 1000  # bytes
         return nand_writes, host_writes
     return None, None
 
+# NVMe admin passthrough: _IOWR('N', 0x41, struct nvme_passthru_cmd)
+NVME_IOCTL_ADMIN_CMD = 0xC0484E41
+NVME_ADMIN_GET_LOG_PAGE = 0x02
+NVME_NSID_ALL = 0xFFFFFFFF
+SMART_LOG_ID = 0x02
+OCP_SMART_LOG_ID = 0xC0  # OCP Datacenter NVMe SSD spec: SMART / Health Information Extended
+LOG_PAGE_SIZE = 512
+# Log page GUID in bytes 496-511 of the OCP 0xC0 page, as stored on the wire (little endian)
+OCP_SMART_LOG_GUID = bytes.fromhex("c5af1028eabff2a49c4f6f7cc914d5af")
+
+# struct nvme_passthru_cmd from linux/nvme_ioctl.h: opcode, flags, rsvd1, nsid, cdw2, cdw3,
+# metadata, addr, metadata_len, data_len, cdw10-cdw15, timeout_ms, result
+PASSTHRU_CMD = struct.Struct("=BBHIIIQQII6III")
+
+def decode_smart_log(page):
+    """Host bytes written from a raw SMART / Health log page (0x02)"""
+    if len(page) < LOG_PAGE_SIZE:
+        raise ValueError(f"SMART log page is {len(page)} bytes, expected {LOG_PAGE_SIZE}")
+    # Bytes 48-63: Data Units Written, 128-bit, in thousands of 512 byte units
+    data_units_written = int.from_bytes(page[48:64], "little")
+    return data_units_written * 512 * 1000
+
+def decode_ocp_smart_log(page):
+    """NAND bytes written from a raw OCP SMART / Health Extended log page (0xC0)"""
+    if len(page) < LOG_PAGE_SIZE:
+        raise ValueError(f"OCP log page is {len(page)} bytes, expected {LOG_PAGE_SIZE}")
+    if bytes(page[496:512]) != OCP_SMART_LOG_GUID:
+        raise ValueError("OCP log page GUID mismatch, device does not implement the OCP 0xC0 page")
+    # Bytes 0-15: Physical Media Units Written, 128-bit, in bytes
+    return int.from_bytes(page[0:16], "little")
+
+class IoctlBackend:
+    """Reads log pages with the NVMe admin passthrough ioctl on the controller device.
+
+    Needs root (CAP_SYS_ADMIN). The decoders take raw page bytes, so they can be
+    checked against pages saved with `nvme get-log <dev> -i 0x02 -l 512 -b`.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.fd = os.open(device, os.O_RDONLY)
+        self.buffer = ctypes.create_string_buffer(LOG_PAGE_SIZE)
+
+    def get_log_page(self, log_id):
+        num_dwords = LOG_PAGE_SIZE // 4 - 1
+        cmd = bytearray(PASSTHRU_CMD.pack(
+            NVME_ADMIN_GET_LOG_PAGE, 0, 0, NVME_NSID_ALL, 0, 0,
+            0, ctypes.addressof(self.buffer), 0, LOG_PAGE_SIZE,
+            log_id | ((num_dwords & 0xFFFF) << 16), num_dwords >> 16, 0, 0, 0, 0,
+            0, 0))
+        status = fcntl.ioctl(self.fd, NVME_IOCTL_ADMIN_CMD, cmd, True)
+        if status != 0:
+            raise OSError(f"Get Log Page 0x{log_id:02x} failed with NVMe status 0x{status:x}")
+        return self.buffer.raw
+
+    def read_writes(self):
+        host_writes = decode_smart_log(self.get_log_page(SMART_LOG_ID))
+        nand_writes = decode_ocp_smart_log(self.get_log_page(OCP_SMART_LOG_ID))
+        return nand_writes, host_writes
+
+class NvmeCliBackend:
+    """Reads log pages through nvme-cli JSON output."""
+
+    def __init__(self, device):
+        self.device = device
+
+    def read_writes(self):
+        nvme_smart_log = run_nvme_command(["smart-log", self.device])
+        nvme_ocp_log = run_nvme_command(["ocp", "smart-add-log", self.device])
+        return calculate_writes(nvme_smart_log, nvme_ocp_log)
+
+def open_backend(device, backend="auto"):
+    """Prefer the ioctl backend, falling back to nvme-cli if it cannot read both log pages"""
+    if backend in ("auto", "ioctl"):
+        ioctl_backend = None
+        try:
+            ioctl_backend = IoctlBackend(device)
+            ioctl_backend.read_writes()
+            return ioctl_backend
+        except (OSError, ValueError) as e:
+            if ioctl_backend is not None:
+                os.close(ioctl_backend.fd)
+            if backend == "ioctl":
+                raise
+            print(f"{device}: ioctl backend unavailable ({e}), using nvme-cli")
+    return NvmeCliBackend(device)
+
+def list_controllers():
+    # NVMe controller character devices, e.g. /dev/nvme0 (not namespaces like /dev/nvme0n1)
+    names = [name for name in os.listdir("/dev") if re.fullmatch(r"nvme\d+", name)]
+    return [f"/dev/{name}" for name in sorted(names, key=lambda name: int(name[4:]))]
+
+def sample_device(device, backend, interval, start, stop, samples):
+    """Sample one controller on the shared tick grid.
+
+    Ticks are start + n * interval on the monotonic clock, so sampling does not
+    drift with command run time, and every device samples at the same instants.
+    Each device has its own thread, so a slow controller only delays itself.
+    """
+    try:
+        reader = open_backend(device, backend)
+    except (OSError, ValueError) as e:
+        print(f"{device}: {e}")
+        return
+
+    tick = 0
+    while not stop.is_set():
+        tick_time = start + tick * interval
+        if stop.wait(max(0, tick_time - time.monotonic())):
+            break
+
+        try:
+            nand_writes, host_writes = reader.read_writes()
+        except (OSError, ValueError) as e:
+            print(f"{device}: {e}")
+            nand_writes, host_writes = None, None
+        if nand_writes is not None and host_writes is not None:
+            samples.put((tick_time, device, nand_writes, host_writes))
+
+        # If the read overran one or more ticks, skip them rather than bursting to catch up
+        tick = max(tick + 1, int((time.monotonic() - start) // interval) + 1)
+
+def parse_window(text):
+    """Window length in seconds from e.g. '30s', '1m', '1h'"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def waf(nand_delta, host_delta):
+    return nand_delta / host_delta if host_delta > 0 else None
+
+class WafTracker:
+    """Instantaneous and rolling-window WAF for one device.
+
+    Each window keeps a deque of samples trimmed from the left as they age out,
+    so its oldest entry is the newest sample at or before the window start.
+    Each sample costs amortized O(1) per window.
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+        self.history = {name: deque() for name in windows}
+        self.previous = None
+
+    def add(self, timestamp, nand_writes, host_writes):
+        """Record a sample, returning {'instant': waf, <window>: waf, ...} (None where undefined)"""
+        result = {"instant": None}
+        if self.previous is not None:
+            result["instant"] = waf(nand_writes - self.previous[1], host_writes - self.previous[2])
+        self.previous = (timestamp, nand_writes, host_writes)
+
+        for name, seconds in self.windows.items():
+            history = self.history[name]
+            history.append(self.previous)
+            while len(history) > 1 and history[1][0] <= timestamp - seconds:
+                history.popleft()
+            _, oldest_nand, oldest_host = history[0]
+            result[name] = waf(nand_writes - oldest_nand, host_writes - oldest_host)
+        return result
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the latest samples in the Prometheus text format on /metrics."""
+
+    latest = {}  # device -> (nand_writes, host_writes, {window: waf})
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        with self.lock:
+            latest = dict(self.latest)
+
+        lines = [
+            "# HELP nvme_nand_written_bytes_total Physical media bytes written (OCP log 0xC0).",
+            "# TYPE nvme_nand_written_bytes_total counter",
+        ]
+        lines += [f'nvme_nand_written_bytes_total{{device="{device}"}} {nand}' for device, (nand, _, _) in latest.items()]
+        lines += [
+            "# HELP nvme_host_written_bytes_total Host bytes written (SMART data units written).",
+            "# TYPE nvme_host_written_bytes_total counter",
+        ]
+        lines += [f'nvme_host_written_bytes_total{{device="{device}"}} {host}' for device, (_, host, _) in latest.items()]
+        lines += [
+            "# HELP nvme_write_amplification NAND bytes written per host byte written over the window.",
+            "# TYPE nvme_write_amplification gauge",
+        ]
+        lines += [f'nvme_write_amplification{{device="{device}",window="{window}"}} {value}'
+                  for device, (_, _, wafs) in latest.items()
+                  for window, value in wafs.items() if value is not None]
+
+        body = ("\n".join(lines) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
 # Main function to run the commands and log to CSV
-def log_nvme_data(interval, csv_file):
-    # Open the CSV file to write, flush=True ensures the data is written immediately
+def log_nvme_data(interval, csv_file, devices, backend="auto", windows=None):
+    windows = windows if windows is not None else {name: parse_window(name) for name in WINDOWS}
+    trackers = {device: WafTracker(windows) for device in devices}
+    samples = queue.Queue()
+    stop = threading.Event()
+
+    # Align the first tick to a whole multiple of the interval on the wall clock
+    wall_start = (time.time() // interval + 1) * interval
+    start = time.monotonic() + (wall_start - time.time())
+
+    threads = [threading.Thread(target=sample_device, args=(device, backend, interval, start, stop, samples), daemon=True)
+               for device in devices]
+    for thread in threads:
+        thread.start()
+
+    # Open the CSV file to write; one writer thread (this one) owns the file
     with open(csv_file, 'w', newline='') as file:
         writer = csv.writer(file)
         # Write the header
-        writer.writerow(["Timestamp", "NAND Writes (Bytes)", "Host Writes (Bytes)"])
+        writer.writerow(["Timestamp", "Device", "NAND Writes (Bytes)", "Host Writes (Bytes)", "WAF"] +
+                        [f"WAF {name}" for name in windows])
         file.flush()
 
-        while True:
-            # Run both commands
-            smart_log_command = "sudo nvme smart-log /dev/nvme0 -o=json"
-            ocp_log_command = "sudo nvme ocp smart-add-log /dev/nvme0 -o=json"
+        try:
+            while True:
+                tick_time, device, nand_writes, host_writes = samples.get()
 
-            # Fetch logs
-            nvme_smart_log = run_nvme_command(smart_log_command)
-            nvme_ocp_log = run_nvme_command(ocp_log_command)
+                # Timestamp of the scheduled tick, so samples from different devices line up
+                wall_time = wall_start + (tick_time - start)
+                timestamp = datetime.fromtimestamp(wall_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
-            # Calculate NAND writes and host writes
-            nand_writes, host_writes = calculate_writes(nvme_smart_log, nvme_ocp_log)
-
-            if nand_writes is not None and host_writes is not None:
-                # Get the current timestamp
-                timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+                wafs = trackers[device].add(tick_time, nand_writes, host_writes)
+                with MetricsHandler.lock:
+                    MetricsHandler.latest[device] = (nand_writes, host_writes, wafs)
 
                 # Write the data to CSV
-                writer.writerow([timestamp, nand_writes, host_writes])
-                print(f"{timestamp} - NAND Writes: {nand_writes}, Host Writes: {host_writes}")
+                writer.writerow([timestamp, device, nand_writes, host_writes] +
+                                ["" if value is None else f"{value:.4f}" for value in wafs.values()])
+                rolling = ", ".join(f"WAF {name}: {value:.4f}" for name, value in wafs.items() if value is not None)
+                print(f"{timestamp} - {device} - NAND Writes: {nand_writes}, Host Writes: {host_writes}"
+                      + (f", {rolling}" if rolling else ""))
 
                 # Ensure the data is immediately written to the file
                 file.flush()
+        except KeyboardInterrupt:
+            stop.set()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Log NAND and host writes for NVMe controllers to CSV")
+    parser.add_argument("devices", nargs="*", help="Controllers to sample, e.g. /dev/nvme0 (default: all)")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help=f"Seconds between samples (default {INTERVAL})")
+    parser.add_argument("--csv", default=CSV_FILE, help=f"Output CSV file (default {CSV_FILE})")
+    parser.add_argument("--backend", choices=["auto", "ioctl", "nvme-cli"], default="auto",
+                        help="How to read log pages: admin passthrough ioctl, nvme-cli, or ioctl with nvme-cli fallback")
+    parser.add_argument("--windows", default=",".join(WINDOWS),
+                        help=f"Comma separated rolling WAF windows (default {','.join(WINDOWS)})")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"Port for the Prometheus /metrics endpoint, 0 to disable (default {METRICS_PORT})")
+    return parser.parse_args()
 
-            # Wait for the specified interval
-            time.sleep(interval)
+if __name__ == "__main__":
+    args = parse_args()
+    devices = args.devices or list_controllers()
+    if not devices:
+        raise SystemExit("No NVMe controllers found")
 
-# Set the interval (in seconds) and CSV file path
-interval = 10  # Example: log every 60 seconds
-csv_file = "nvme_log.csv"
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
 
-# Start logging
-log_nvme_data(interval, csv_file)
+    # Start logging
+    windows = {name: parse_window(name) for name in args.windows.split(",") if name}
+    log_nvme_data(args.interval, args.csv, devices, args.backend, windows)